@@ -8,6 +8,35 @@ from datetime import datetime
 from typing import Optional, List
 import re
 
+# Güvenlik regex'leri - modül yüklenirken bir kez derlenir
+# SQL injection ve XSS koruması için tehlikeli karakter/dizi kalıpları
+_PW_BAD_RE = re.compile(r"""[<>"';]|--|/\*|\*/""")
+_EMAIL_BAD_RE = re.compile(r"""[<>"';(){}]|--|/\*|\*/""")
+_EMAIL_FORMAT_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
+def _scrub_email(cls, v: str) -> str:
+    """
+    E-posta validasyonu - ek güvenlik kontrolleri
+    UserRegister ve UserLogin tarafından ortak kullanılır
+    """
+    if not v:
+        raise ValueError("E-posta boş olamaz")
+    
+    # E-posta formatı kontrolü (EmailStr zaten kontrol ediyor ama ekstra güvenlik)
+    if not _EMAIL_FORMAT_RE.match(v):
+        raise ValueError("Geçersiz e-posta formatı")
+    
+    # SQL injection koruması - tehlikeli karakterleri kontrol et
+    if _EMAIL_BAD_RE.search(v):
+        raise ValueError("E-posta güvenlik nedeniyle geçersiz karakter içeriyor")
+    
+    # E-posta uzunluğu kontrolü
+    if len(v) > 255:
+        raise ValueError("E-posta çok uzun (maksimum 255 karakter)")
+    
+    return v.lower().strip()  # Küçük harfe çevir ve boşlukları temizle
+
 
 class UserRegister(BaseModel):
     """
@@ -35,10 +64,8 @@ class UserRegister(BaseModel):
             raise ValueError("Şifre boş olamaz")
         
         # SQL injection ve XSS koruması - tehlikeli karakterleri kontrol et
-        dangerous_chars = ['<', '>', '"', "'", ';', '--', '/*', '*/']
-        for char in dangerous_chars:
-            if char in v:
-                raise ValueError(f"Şifre güvenlik nedeniyle geçersiz karakter içeriyor")
+        if _PW_BAD_RE.search(v):
+            raise ValueError("Şifre güvenlik nedeniyle geçersiz karakter içeriyor")
         
         # Minimum uzunluk kontrolü (Field'da zaten var ama ekstra kontrol)
         if len(v) < 8:
@@ -104,31 +131,7 @@ class UserRegister(BaseModel):
         
         return v.strip()
     
-    @field_validator('email')
-    @classmethod
-    def validate_email(cls, v: str) -> str:
-        """
-        E-posta validasyonu - ek güvenlik kontrolleri
-        """
-        if not v:
-            raise ValueError("E-posta boş olamaz")
-        
-        # E-posta formatı kontrolü (EmailStr zaten kontrol ediyor ama ekstra güvenlik)
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, v):
-            raise ValueError("Geçersiz e-posta formatı")
-        
-        # SQL injection koruması - tehlikeli karakterleri kontrol et
-        dangerous_chars = ['<', '>', '"', "'", ';', '--', '/*', '*/', '(', ')', '{', '}']
-        for char in dangerous_chars:
-            if char in v:
-                raise ValueError("E-posta güvenlik nedeniyle geçersiz karakter içeriyor")
-        
-        # E-posta uzunluğu kontrolü
-        if len(v) > 255:
-            raise ValueError("E-posta çok uzun (maksimum 255 karakter)")
-        
-        return v.lower().strip()  # Küçük harfe çevir ve boşlukları temizle
+    validate_email = field_validator('email')(classmethod(_scrub_email))
 
 
 class UserLogin(BaseModel):
@@ -143,20 +146,8 @@ class UserLogin(BaseModel):
     email: EmailStr = Field(..., description="Kullanıcı e-posta adresi")
     password: str = Field(..., min_length=1, max_length=100, description="Kullanıcı şifresi")
     
-    @field_validator('email')
-    @classmethod
-    def validate_email(cls, v: str) -> str:
-        """E-posta validasyonu - UserRegister ile aynı"""
-        if not v:
-            raise ValueError("E-posta boş olamaz")
-        
-        # SQL injection koruması
-        dangerous_chars = ['<', '>', '"', "'", ';', '--', '/*', '*/']
-        for char in dangerous_chars:
-            if char in v:
-                raise ValueError("E-posta güvenlik nedeniyle geçersiz karakter içeriyor")
-        
-        return v.lower().strip()
+    # E-posta validasyonu - UserRegister ile aynı fonksiyon
+    validate_email = field_validator('email')(classmethod(_scrub_email))
 
 
 class UserResponse(BaseModel):
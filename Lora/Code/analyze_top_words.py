@@ -6,7 +6,19 @@ import json
 import re
 from collections import Counter
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
+
+from log_utils import get_chunked_logger
+
+# Opsiyonel: ijson varsa JSON akış halinde okunur, dict/list objeleri oluşturulmaz
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+
+logger = get_chunked_logger(__name__)
 
 # Dinamik dosya yolları - Script'in bulunduğu klasöre göre otomatik ayarlanır
 SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -16,6 +28,9 @@ DATA_DIR = PROJECT_ROOT / "Lora" / "Data"
 # Dosya yolu
 INPUT_FILE = DATA_DIR / "final2.json"
 
+# Türkçe karakterli kelimeleri de yakalamak için regex (\w+ Unicode harfleri de dahil eder)
+_WORD_RE = re.compile(r'\b\w+\b')
+
 
 def extract_words(text: str) -> List[str]:
     """
@@ -30,9 +45,7 @@ def extract_words(text: str) -> List[str]:
     if not text or not isinstance(text, str):
         return []
     
-    # Türkçe karakterli kelimeleri de yakalamak için regex kullan
-    # \w+ Unicode harfleri de dahil eder (Türkçe karakterler dahil)
-    words = re.findall(r'\b\w+\b', text.lower())
+    words = _WORD_RE.findall(text.lower())
     
     return words
 
@@ -47,99 +60,138 @@ def count_words_in_dataset(data: List[Dict[str, str]]) -> Counter:
     Returns:
         Counter: Kelime sayılarını tutan Counter objesi
     """
-    all_words = []
+    # Tek bir sayaç tutulur; kelimeler mesaj başına eklenir, tüm korpusun
+    # kelime listesi bellekte biriktirilmez
+    word_counter = Counter()
     
     try:
         for item in data:
             if not isinstance(item, dict):
                 continue
             
-            # User mesajından kelimeleri çıkar
-            user_text = item.get('user', '')
-            if user_text:
-                words = extract_words(user_text)
-                all_words.extend(words)
-            
-            # Assistant mesajından kelimeleri çıkar
-            assistant_text = item.get('assistant', '')
-            if assistant_text:
-                words = extract_words(assistant_text)
-                all_words.extend(words)
-        
-        # Kelime sayılarını hesapla
-        word_counter = Counter(all_words)
+            # User ve assistant mesajlarından kelimeleri çıkar
+            for key in ('user', 'assistant'):
+                text = item.get(key, '')
+                if text:
+                    word_counter.update(extract_words(text))
         
         return word_counter
         
     except Exception as e:
-        print(f"[ERROR] Kelime sayma hatası: {e}")
+        logger.error(f"[ERROR] Kelime sayma hatası: {e}")
         raise
 
 
+def count_words_in_file(input_file: Path) -> Tuple[Counter, int]:
+    """
+    JSON dosyasını ijson ile akış halinde okuyup kelimeleri sayar.
+    user/assistant string değerleri doğrudan sayaca beslenir; ara dict/list
+    objeleri oluşturulmaz.
+    
+    Args:
+        input_file: Okunacak JSON dosyası (diyalog listesi)
+        
+    Returns:
+        Tuple[Counter, int]: Kelime sayaçları ve diyalog sayısı
+        
+    Raises:
+        ValueError: JSON kökü array değilse
+    """
+    word_counter = Counter()
+    dialogue_count = 0
+    
+    with open(input_file, 'rb') as f:
+        for prefix, event, value in ijson.parse(f):
+            if prefix == '':
+                if event != 'start_array' and event != 'end_array':
+                    raise ValueError(f"JSON dosyası array formatında olmalı, alınan olay: {event}")
+            elif event == 'start_map' and prefix == 'item':
+                dialogue_count += 1
+            elif event == 'string' and (prefix == 'item.user' or prefix == 'item.assistant'):
+                if value:
+                    word_counter.update(_WORD_RE.findall(value.lower()))
+    
+    return word_counter, dialogue_count
+
+
 def main():
     """
     Ana fonksiyon - final.json dosyasını okuyup en çok kullanılan 10 kelimeyi bulur.
     """
-    print("=" * 80)
-    print("VERİSETİNDEKİ EN ÇOK KULLANILAN 10 KELİME ANALİZİ")
-    print("=" * 80)
-    print(f"Girdi dosyası: {INPUT_FILE}")
-    print("=" * 80)
-    print()
+    logger.info("=" * 80)
+    logger.info("VERİSETİNDEKİ EN ÇOK KULLANILAN 10 KELİME ANALİZİ")
+    logger.info("=" * 80)
+    logger.info(f"Girdi dosyası: {INPUT_FILE}")
+    logger.info("=" * 80)
+    logger.info("")
     
     # Dosya varlık kontrolü
     if not INPUT_FILE.exists():
-        print(f"[ERROR] Dosya bulunamadı: {INPUT_FILE}")
+        logger.error(f"[ERROR] Dosya bulunamadı: {INPUT_FILE}")
         return 1
     
     try:
         # JSON dosyasını oku
-        print(f"[READ] JSON dosyası okunuyor: {INPUT_FILE}")
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if not isinstance(data, list):
-            print(f"[ERROR] JSON dosyası array formatında olmalı, alınan tip: {type(data)}")
-            return 1
-        
-        print(f"[READ] Toplam {len(data)} diyalog okundu")
-        print()
-        
-        # Kelimeleri say
-        print("[ANALYZE] Kelimeler analiz ediliyor...")
-        word_counter = count_words_in_dataset(data)
+        logger.info(f"[READ] JSON dosyası okunuyor: {INPUT_FILE}")
+        if IJSON_AVAILABLE:
+            # Okuma ve sayma tek geçişte yapılır
+            logger.info("[ANALYZE] Kelimeler analiz ediliyor (ijson akış modu)...")
+            try:
+                word_counter, dialogue_count = count_words_in_file(INPUT_FILE)
+            except ValueError as e:
+                logger.error(f"[ERROR] {e}")
+                return 1
+            except ijson.JSONError as e:
+                logger.error(f"[ERROR] JSON parse hatası: {e}")
+                return 1
+            logger.info(f"[READ] Toplam {dialogue_count} diyalog okundu")
+            logger.info("")
+        else:
+            with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            
+            if not isinstance(data, list):
+                logger.error(f"[ERROR] JSON dosyası array formatında olmalı, alınan tip: {type(data)}")
+                return 1
+            
+            logger.info(f"[READ] Toplam {len(data)} diyalog okundu")
+            logger.info("")
+            
+            # Kelimeleri say
+            logger.info("[ANALYZE] Kelimeler analiz ediliyor...")
+            word_counter = count_words_in_dataset(data)
         
         total_words = sum(word_counter.values())
         unique_words = len(word_counter)
         
-        print(f"[ANALYZE] Toplam {total_words} kelime, {unique_words} farklı kelime bulundu")
-        print()
+        logger.info(f"[ANALYZE] Toplam {total_words} kelime, {unique_words} farklı kelime bulundu")
+        logger.info("")
         
         # En çok kullanılan 10 kelimeyi al
         top_words = word_counter.most_common(10)
         
         # Sonuçları yazdır
-        print("=" * 80)
-        print("EN ÇOK KULLANILAN 10 KELİME:")
-        print("=" * 80)
+        logger.info("=" * 80)
+        logger.info("EN ÇOK KULLANILAN 10 KELİME:")
+        logger.info("=" * 80)
         for i, (word, count) in enumerate(top_words, 1):
             percentage = (count / total_words) * 100
-            print(f"{i:2d}. {word:20s} : {count:6d} kez ({percentage:5.2f}%)")
-        print("=" * 80)
+            logger.info(f"{i:2d}. {word:20s} : {count:6d} kez ({percentage:5.2f}%)")
+        logger.info("=" * 80)
         
         return 0
         
     except json.JSONDecodeError as e:
-        print(f"[ERROR] JSON parse hatası: {e}")
+        logger.error(f"[ERROR] JSON parse hatası: {e}")
         return 1
     except FileNotFoundError as e:
-        print(f"[ERROR] Dosya bulunamadı: {e}")
+        logger.error(f"[ERROR] Dosya bulunamadı: {e}")
         return 1
     except PermissionError as e:
-        print(f"[ERROR] Dosya izin hatası: {e}")
+        logger.error(f"[ERROR] Dosya izin hatası: {e}")
         return 1
     except Exception as e:
-        print(f"[ERROR] Beklenmeyen hata: {e}")
+        logger.error(f"[ERROR] Beklenmeyen hata: {e}")
         import traceback
         traceback.print_exc()
         return 1
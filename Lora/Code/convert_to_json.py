@@ -6,17 +6,26 @@ JSON çıktısı: [{"user": "...", "assistant": "..."}, ...]
 """
 
 import json
+import mmap
 import re
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
+from log_utils import get_chunked_logger
 
-def parse_dialogue_line(line: str) -> Dict[str, str]:
+
+logger = get_chunked_logger(__name__)
+
+# Satırlar bytes olarak eşlenir; yalnızca yakalanan iki mesaj parçası decode edilir
+_DIALOGUE_RE = re.compile(rb'^user:\s*(.+?)\s+assistant:\s*(.+)$', re.IGNORECASE)
+
+
+def parse_dialogue_line(line: bytes) -> Optional[Dict[str, str]]:
     """
     Bir diyalog satırını parse eder ve user/assistant mesajlarını ayırır.
     
     Args:
-        line: Diyalog satırı (format: "user: ... assistant: ...")
+        line: UTF-8 kodlu diyalog satırı (format: "user: ... assistant: ...")
         
     Returns:
         Dict: {"user": "...", "assistant": "..."} formatında dict
@@ -27,16 +36,14 @@ def parse_dialogue_line(line: str) -> Dict[str, str]:
     
     # "user:" ve "assistant:" ayırıcılarını bul
     # Regex ile güvenli şekilde parse et
-    pattern = r'^user:\s*(.+?)\s+assistant:\s*(.+)$'
-    match = re.match(pattern, line, re.IGNORECASE)
+    match = _DIALOGUE_RE.match(line)
     
     if match:
-        user_msg = match.group(1).strip()
-        assistant_msg = match.group(2).strip()
+        user_msg = match.group(1).decode('utf-8').strip()
+        assistant_msg = match.group(2).decode('utf-8').strip()
         return {"user": user_msg, "assistant": assistant_msg}
     else:
-        # Eğer format uymazsa, raw olarak kaydet
-        print(f"[WARNING] Parse edilemedi: {line[:50]}...")
+        # Format uymazsa None döner; uyarıyı çağıran taraf toplu halde loglar
         return None
 
 
@@ -55,40 +62,58 @@ def convert_txt_to_json(input_file: Path, output_file: Path) -> None:
     total_lines = 0
     parsed_lines = 0
     error_lines = 0
+    error_samples = []  # İlk 5 hatalı satır, sonda toplu loglanır
     
-    print(f"[CONVERT] Dosya okunuyor: {input_file}")
+    logger.info(f"[CONVERT] Dosya okunuyor: {input_file}")
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                total_lines += 1
-                
-                # Satırı parse et
-                parsed = parse_dialogue_line(line)
-                
-                if parsed:
-                    dialogues.append(parsed)
-                    parsed_lines += 1
-                else:
-                    error_lines += 1
-                    if error_lines <= 5:  # İlk 5 hatayı göster
-                        print(f"[WARNING] Satır {line_num} parse edilemedi: {line[:80]}...")
+        # Dosya belleğe eşlenir (mmap); satır başına str üretilmez, decode
+        # yalnızca parse edilen mesaj parçalarında yapılır
+        with open(input_file, 'rb') as f:
+            size = input_file.stat().st_size
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+            try:
+                pos = 0
+                while pos < size:
+                    nl = mm.find(b'\n', pos)
+                    end = nl if nl != -1 else size
+                    line = mm[pos:end]
+                    pos = end + 1
+                    total_lines += 1
+                    
+                    # Satırı parse et
+                    parsed = parse_dialogue_line(line)
+                    
+                    if parsed:
+                        dialogues.append(parsed)
+                        parsed_lines += 1
+                    else:
+                        error_lines += 1
+                        if error_lines <= 5:  # İlk 5 hatayı göster
+                            sample = line[:80].decode('utf-8', errors='replace').rstrip()
+                            error_samples.append((total_lines, sample))
+            finally:
+                if size:
+                    mm.close()
+        
+        for line_num, sample in error_samples:
+            logger.warning(f"[WARNING] Satır {line_num} parse edilemedi: {sample}...")
         
-        print(f"[CONVERT] İstatistikler:")
-        print(f"[CONVERT] - Toplam satır: {total_lines}")
-        print(f"[CONVERT] - Başarıyla parse edilen: {parsed_lines}")
-        print(f"[CONVERT] - Hatalı satır: {error_lines}")
+        logger.info(f"[CONVERT] İstatistikler:")
+        logger.info(f"[CONVERT] - Toplam satır: {total_lines}")
+        logger.info(f"[CONVERT] - Başarıyla parse edilen: {parsed_lines}")
+        logger.info(f"[CONVERT] - Hatalı satır: {error_lines}")
         
         if len(dialogues) == 0:
             raise ValueError("Hiçbir diyalog parse edilemedi!")
         
         # JSON formatında kaydet (indent=2 ile okunabilir format)
-        print(f"[CONVERT] JSON dosyası yazılıyor: {output_file}")
+        logger.info(f"[CONVERT] JSON dosyası yazılıyor: {output_file}")
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(dialogues, f, ensure_ascii=False, indent=2)
         
-        print(f"[CONVERT] Başarılı! {len(dialogues)} diyalog JSON formatına çevrildi.")
-        print(f"[CONVERT] Çıktı dosyası: {output_file}")
+        logger.info(f"[CONVERT] Başarılı! {len(dialogues)} diyalog JSON formatına çevrildi.")
+        logger.info(f"[CONVERT] Çıktı dosyası: {output_file}")
         
     except Exception as e:
         raise Exception(f"Dosya dönüştürme hatası: {e}")
@@ -104,24 +129,24 @@ def main():
     input_file = data_dir / "final.txt"
     output_file = data_dir / "final.json"
     
-    print("=" * 80)
-    print("TXT -> JSON DÖNÜŞTÜRÜCÜ")
-    print("=" * 80)
-    print(f"Girdi dosyası: {input_file}")
-    print(f"Çıktı dosyası: {output_file}")
-    print("=" * 80)
-    print()
+    logger.info("=" * 80)
+    logger.info("TXT -> JSON DÖNÜŞTÜRÜCÜ")
+    logger.info("=" * 80)
+    logger.info(f"Girdi dosyası: {input_file}")
+    logger.info(f"Çıktı dosyası: {output_file}")
+    logger.info("=" * 80)
+    logger.info("")
     
     try:
         convert_txt_to_json(input_file, output_file)
         
-        print()
-        print("=" * 80)
-        print("DÖNÜŞTÜRME TAMAMLANDI!")
-        print("=" * 80)
+        logger.info("")
+        logger.info("=" * 80)
+        logger.info("DÖNÜŞTÜRME TAMAMLANDI!")
+        logger.info("=" * 80)
         
     except Exception as e:
-        print(f"\n[ERROR] Hata oluştu: {e}")
+        logger.error("[ERROR] Hata oluştu: %s", e)
         import traceback
         traceback.print_exc()
         return 1
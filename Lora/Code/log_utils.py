@@ -0,0 +1,50 @@
+"""
+Lora/Code script'lerinin ortak log yardımcıları.
+Script'ler log satırlarını print() yerine bellekte biriktirip stdout'a toplu yazan logger ile basar.
+"""
+
+import logging
+import logging.handlers
+import sys
+
+
+class ChunkedStdoutHandler(logging.handlers.BufferingHandler):
+    """
+    Log kayıtlarını bellekte biriktirip stdout'a tek seferde yazan handler.
+    Her print() çağrısının ayrı write+flush yapmasını engeller; ERROR ve
+    üstü seviyeler beklemeden yazılır.
+    """
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return super().shouldFlush(record) or record.levelno >= logging.ERROR
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.buffer:
+                sys.stdout.write("\n".join(self.format(r) for r in self.buffer) + "\n")
+                sys.stdout.flush()
+                self.buffer.clear()
+        finally:
+            self.release()
+
+
+def get_chunked_logger(name: str, capacity: int = 10_000) -> logging.Logger:
+    """
+    Mesajları düz metin olarak ChunkedStdoutHandler üzerinden yazan INFO seviyeli logger döndürür.
+
+    Args:
+        name: Logger adı (genelde __name__)
+        capacity: Stdout'a yazılmadan önce bellekte tutulacak en fazla kayıt sayısı
+
+    Returns:
+        logging.Logger: Yapılandırılmış logger (handler bir kez eklenir)
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = ChunkedStdoutHandler(capacity=capacity)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
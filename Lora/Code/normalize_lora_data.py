@@ -10,20 +10,61 @@ Format dönüşümleri:
 3. "user: ... assistant: ..." → "user: ... assistant: ..." (zaten doğru)
 """
 
+import codecs
 import re
 import os
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
+# Opsiyonel: charset-normalizer varsa UTF-8 olmayan dosyaların encoding'i tahmin edilir
+try:
+    import charset_normalizer
+    CHARSET_NORMALIZER_AVAILABLE = True
+except ImportError:
+    CHARSET_NORMALIZER_AVAILABLE = False
 
-def normalize_line(line: str) -> str:
+# Regex kalıpları modül yüklenirken bir kez derlenir (satır başına re cache araması yapılmaz)
+# Normalizasyon bytes üzerinde yapılır: işaretler (user:, assistant:, Diyalog, rakamlar) ASCII
+# olduğu için satırlar decode edilmeden taranır, sadece çıktıya giden satırlar decode edilir
+# Format 1 ve 3 tek alternasyonda: opsiyonel "Diyalog X " / "X. " öneki + "user: ... assistant: ..."
+# bytes IGNORECASE sadece ASCII harfleri katlar: str sürümünün eşlediği "DİYALOG" / "dıyalog" / "ASSİSTANT:" /
+# "assıstant:" yazımları için 'i' konumlarında İ/ı'nın UTF-8 (C4 B0 / C4 B1) ve cp1254 (DD / FD) baytları da kabul edilir
+_I = rb'(?:i|\xc4[\xb0\xb1]|[\xdd\xfd])'
+_ASSISTANT = rb'ass' + _I + rb'stant:'
+_P_ALL = re.compile(rb'^(?:D' + _I + rb'yalog\s+\d+\s+|\d+\.\s*)?(user:.*' + _ASSISTANT + rb'.*)$', re.IGNORECASE)
+_P_NUMUSER = re.compile(rb'^\d+\.\s*user:(.*)$', re.IGNORECASE)  # Format 2 - ilk satır
+_P_ASSIST_PREFIX = re.compile(rb'^' + _ASSISTANT, re.IGNORECASE)  # Format 2 - ikinci satır
+_HAS_BOTH = re.compile(r'user:.*assistant:', re.IGNORECASE)  # Doğrulama: iki rol de var mı
+
+# Çıktı yazma tamponu (1 MiB) - kısa satır yazımlarını daha az sistem çağrısında birleştirir
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Encoding tespiti için dosyanın başından okunan örnek boyutu (1 MiB)
+ENCODING_SNIFF_SIZE = 1 << 20
+# Tespit edilen encoding ile decode hatası olursa kullanılır (her baytı kabul eder)
+FALLBACK_ENCODING = 'latin-1'
+# Bytes taramasının çalışması için encoding'in bu ASCII işaretlerini aynen kodlaması gerekir
+_ASCII_MARKERS = 'Diyalog user: assistant: 0123456789.\t\r\n'
+
+
+def normalize_line(line: bytes) -> Optional[bytes]:
     """
     Tek bir satırı normalize eder ve temizler
     
     Args:
-        line: Normalize edilecek satır
+        line: Normalize edilecek satır (ham bytes)
         
     Returns:
-        str: Normalize edilmiş satır (boş ise None döner)
+        bytes: Normalize edilmiş satır (boş ise None döner)
+    
+    Örnek (Türkçe İ/ı yazımları da eşleşir; `python -m doctest normalize_lora_data.py` ile doğrulanır):
+        >>> normalize_line('Diyalog 1 user: merhaba ASSİSTANT: selam'.encode('utf-8')).decode('utf-8')
+        'user: merhaba ASSİSTANT: selam'
+        >>> normalize_line('DİYALOG 2 user: naber assıstant: iyi'.encode('utf-8')).decode('utf-8')
+        'user: naber assıstant: iyi'
+        >>> normalize_line('3. USER: selam ASSİSTANT: merhaba'.encode('cp1254')).decode('cp1254')
+        'USER: selam ASSİSTANT: merhaba'
+        >>> normalize_line(b'sadece metin') is None
+        True
     """
     if not line or not line.strip():
         return None
@@ -31,159 +72,206 @@ def normalize_line(line: str) -> str:
     # Başta/sonda boşlukları temizle
     line = line.strip()
     
-    # Format 1: "Diyalog X user: ... assistant: ..." formatını yakala
-    # Regex ile "Diyalog" ve numarayı kaldır
-    pattern1 = r'^Diyalog\s+\d+\s+(user:.*)$'
-    match1 = re.match(pattern1, line, re.IGNORECASE)
-    if match1:
-        # "Diyalog X" kısmını kaldır, sadece "user: ... assistant: ..." kısmını al
-        normalized = match1.group(1).strip()
+    # Format 1: "Diyalog X user: ... assistant: ..." → "Diyalog X" kısmı kaldırılır
+    # Format 3: "user: ... assistant: ..." (başta "61. " gibi numara varsa temizlenir)
+    # Tek geçişte hem önek atılır hem "user:"/"assistant:" varlığı doğrulanır
+    match = _P_ALL.match(line)
+    if match:
+        normalized = match.group(1).strip()
         return normalized if normalized else None
     
     # Format 2 için özel işlem gerekir (iki satırlı), 
     # bu fonksiyon sadece tek satır için çalışır
-    # Format 2 işlemi process_multiline_format() içinde yapılacak
+    # Format 2 işlemi _iter_normalized() içinde yapılır
     
-    # Format 3: Zaten doğru format "user: ... assistant: ..."
-    # Sadece başta sayı ve nokta varsa temizle (örn: "61. user: ...")
-    pattern3 = r'^\d+\.\s*(user:.*)$'
-    match3 = re.match(pattern3, line)
-    if match3:
-        normalized = match3.group(1).strip()
-        return normalized if normalized else None
-    
-    # Eğer "user:" ile başlıyorsa ve "assistant:" içeriyorsa, olduğu gibi bırak
-    if 'user:' in line.lower() and 'assistant:' in line.lower():
-        return line
-    
-    # Sadece "user:" ile başlıyorsa (Format 2 - ilk satır), None döndür
-    # Çünkü bu çok satırlı formatın ilk kısmı, birleştirilmesi gerekiyor
-    if re.match(r'^\d+\.\s*user:', line, re.IGNORECASE):
-        # Format 2'nin ilk satırı, sonraki satırla birleştirilecek
-        return None
-    
-    # Diğer durumlar için None döndür (işlenemeyen format)
+    # Diğer durumlar için None döndür (Format 2 ilk satırı veya işlenemeyen format)
     return None
 
 
-def process_multiline_format(lines: List[str], index: int) -> Tuple[str, int]:
+def detect_encoding(input_file: str) -> str:
     """
-    Format 2 (çok satırlı) için özel işlem yapar
+    Dosyanın encoding'ini baştaki örnekten tek okumada tespit eder
     
-    Format: "X. user: ...\n    assistant: ..."
+    Sıra: UTF-8 BOM → utf-8-sig, geçerli UTF-8 → utf-8,
+    charset-normalizer tahmini, son çare FALLBACK_ENCODING.
     
     Args:
-        lines: Tüm satırların listesi
-        index: İşlenecek satırın indeksi
+        input_file: Girdi dosyası yolu
         
     Returns:
-        Tuple[str, int]: (normalize edilmiş satır, kaç satır kullanıldı)
+        str: Python codec adı
     """
-    current_line = lines[index].strip()
+    with open(input_file, 'rb') as f:
+        head = f.read(ENCODING_SNIFF_SIZE)
     
-    # Format 2: "X. user: ..." ile başlayan satır
-    pattern = r'^\d+\.\s*user:(.*)$'
-    match = re.match(pattern, current_line, re.IGNORECASE)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
     
-    if not match:
-        return None, 0
+    try:
+        # final=False: örneğin sonunda bölünmüş çok baytlı karakter hata sayılmaz
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
     
-    user_part = match.group(1).strip()
+    if CHARSET_NORMALIZER_AVAILABLE:
+        best = charset_normalizer.from_bytes(head).best()
+        if best is not None:
+            return best.encoding
     
-    # Sonraki satırı kontrol et (assistant kısmı)
-    if index + 1 < len(lines):
-        next_line = lines[index + 1].strip()
+    return FALLBACK_ENCODING
+
+
+def _is_ascii_compatible(encoding: str) -> bool:
+    """Encoding ASCII işaretlerini aynen kodluyorsa True (bytes taraması için gerekli)"""
+    if codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig'):
+        return True
+    return _ASCII_MARKERS.encode(encoding, errors='replace') == _ASCII_MARKERS.encode('ascii')
+
+
+def _to_utf8(line: bytes, encoding: str, is_utf8: bool) -> bytes:
+    """Normalize edilmiş satırı decode edip UTF-8 olarak newline ile döndürür"""
+    text = line.decode(encoding)  # Geçersiz bayt varsa UnicodeDecodeError
+    return (line if is_utf8 else text.encode('utf-8')) + b'\n'
+
+
+def _iter_normalized(lines: Iterable[bytes], stats: Dict[str, int], encoding: str) -> Iterator[bytes]:
+    """
+    Satırları akış halinde normalize eder; dosyanın tamamı belleğe alınmaz
+    
+    Format 2 için bir satırlık ileri bakış (pending) kullanılır. Tarama bytes
+    üzerinde yapılır; yalnızca çıktıya giden satırlar decode edilir.
+    
+    Args:
+        lines: Girdi satırları (binary modda açık dosya objesi olabilir)
+        stats: "read", "normalized", "skipped" sayaçları (yerinde güncellenir)
+        encoding: Girdinin encoding'i
+        
+    Yields:
+        bytes: Sonunda newline olan, UTF-8 kodlu normalize edilmiş satır
         
-        # "assistant:" ile başlıyorsa (başta boşluk olabilir)
-        assistant_match = re.match(r'^\s*assistant:(.*)$', next_line, re.IGNORECASE)
-        if assistant_match:
-            assistant_part = assistant_match.group(1).strip()
-            # Birleştir
-            combined = f"user: {user_part} assistant: {assistant_part}"
-            return combined, 2
+    Raises:
+        UnicodeDecodeError: Çıktı satırı verilen encoding ile decode edilemezse
+    """
+    is_utf8 = codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig')
+    it = iter(lines)
+    pending = None  # İleri bakışta okunup henüz işlenmemiş satır
     
-    # Assistant kısmı bulunamadı, sadece user kısmını döndür
-    return f"user: {user_part} assistant:", 1
+    while True:
+        if pending is not None:
+            line, pending = pending, None
+        else:
+            line = next(it, None)
+            if line is None:
+                return
+            stats["read"] += 1
+        
+        # Tek satırlı formatları işle
+        normalized = normalize_line(line)
+        
+        if normalized:
+            stats["normalized"] += 1
+            yield _to_utf8(normalized, encoding, is_utf8)
+            continue
+        
+        # Format 2: "X. user: ...\n    assistant: ..." (çok satırlı) - sadece tek satır eşleşmezse
+        # Numarayla başlamayan satırda regex motoru hiç çalıştırılmaz
+        stripped = line.strip()
+        match = _P_NUMUSER.match(stripped) if stripped[:1].isdigit() else None
+        
+        if match is None:
+            if stripped:
+                # İşlenemeyen format, atla
+                stats["skipped"] += 1
+            continue
+        
+        user_part = match.group(1).strip()
+        
+        # Sonraki satırı kontrol et (assistant kısmı) - bir satırlık ileri bakış
+        pending = next(it, None)
+        if pending is not None:
+            stats["read"] += 1
+            next_line = pending.strip()
+            
+            # "assistant:" ile başlıyorsa (satır strip edildi, büyük/küçük harf ve İ/ı duyarsız)
+            assist_match = _P_ASSIST_PREFIX.match(next_line)
+            if assist_match:
+                assistant_part = next_line[assist_match.end():].strip()
+                pending = None  # Sonraki satır assistant kısmı olarak kullanıldı
+                stats["normalized"] += 1
+                yield _to_utf8(b"user: " + user_part + b" assistant: " + assistant_part, encoding, is_utf8)
+                continue
+        
+        # Assistant kısmı bulunamadı, sadece user kısmını yaz
+        stats["normalized"] += 1
+        yield _to_utf8(b"user: " + user_part + b" assistant:", encoding, is_utf8)
 
 
-def normalize_lora_data(input_file: str, output_file: str) -> None:
+def normalize_lora_data(input_file: str, output_file: str) -> Tuple[int, int]:
     """
     Ana normalizasyon fonksiyonu
     
+    Girdi satır satır okunur ve normalize edilen satırlar doğrudan çıktı
+    dosyasına yazılır. Doğrulama yazma sırasında yapılır; çıktı dosyası
+    tekrar okunmaz.
+    
     Args:
         input_file: Girdi dosyası yolu
         output_file: Çıktı dosyası yolu
+        
+    Returns:
+        Tuple[int, int]: (geçerli diyalog sayısı, geçersiz satır sayısı)
     """
     try:
         # Dosya varlığını kontrol et
         if not os.path.exists(input_file):
             raise FileNotFoundError(f"Dosya bulunamadı: {input_file}")
         
+        # Çıktı dosyası yolu
+        # Güvenlik: Dosya yolunu kontrol et, path injection'a karşı koruma
+        safe_output = os.path.normpath(output_file)
+        output_dir = os.path.dirname(safe_output) if os.path.dirname(safe_output) else '.'
+        
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        
         # Dosyayı güvenli şekilde oku (encoding kontrolü)
-        encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1254']
-        content = None
+        # Encoding dosyanın başından bir kez tespit edilir; örnekten sonra decode
+        # hatası çıkarsa çıktı FALLBACK_ENCODING ile baştan yazılır
+        detected = detect_encoding(input_file)
+        encodings = [detected] if detected == FALLBACK_ENCODING else [detected, FALLBACK_ENCODING]
+        if not _is_ascii_compatible(detected):
+            raise ValueError(f"Desteklenmeyen encoding (ASCII uyumlu değil): {detected}")
+        stats = None
         encoding_used = None
         
         for enc in encodings:
+            stats = {"read": 0, "normalized": 0, "skipped": 0}
             try:
-                with open(input_file, 'r', encoding=enc) as f:
-                    content = f.readlines()
-                    encoding_used = enc
-                    break
+                with open(input_file, 'rb') as src, \
+                        open(safe_output, 'wb', buffering=OUTPUT_BUFFER_SIZE) as dst:
+                    if enc == 'utf-8-sig' and src.read(len(codecs.BOM_UTF8)) != codecs.BOM_UTF8:
+                        src.seek(0)
+                    dst.writelines(_iter_normalized(src, stats, enc))
+                encoding_used = enc
+                break
             except UnicodeDecodeError:
                 continue
         
-        if content is None:
+        if encoding_used is None:
             raise ValueError("Dosya encoding'i algılanamadı")
         
-        print(f"Dosya okundu: {len(content)} satır (encoding: {encoding_used})")
-        
-        normalized_lines = []
-        i = 0
-        skipped_count = 0
-        
-        while i < len(content):
-            line = content[i]
-            
-            # Format 2 kontrolü (çok satırlı format)
-            normalized_line, lines_used = process_multiline_format(content, i)
-            
-            if normalized_line:
-                normalized_lines.append(normalized_line)
-                i += lines_used
-                continue
-            
-            # Tek satırlı formatları işle
-            normalized = normalize_line(line)
-            
-            if normalized:
-                normalized_lines.append(normalized)
-                i += 1
-            else:
-                # Boş satır veya işlenemeyen format, atla
-                if line.strip():
-                    skipped_count += 1
-                i += 1
-        
-        print(f"Normalize edildi: {len(normalized_lines)} diyalog")
-        if skipped_count > 0:
-            print(f"Atlandı: {skipped_count} satır")
-        
-        # Çıktı dosyasına yaz
-        # Güvenlik: Dosya yolunu kontrol et, path injection'a karşı koruma
-        safe_output = os.path.normpath(output_file)
-        output_dir = os.path.dirname(safe_output) if os.path.dirname(safe_output) else '.'
-        
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-        
-        with open(safe_output, 'w', encoding='utf-8') as f:
-            for line in normalized_lines:
-                # Her satırın sonuna newline ekle
-                f.write(line + '\n')
+        print(f"Dosya okundu: {stats['read']} satır (encoding: {encoding_used})")
+        print(f"Normalize edildi: {stats['normalized']} diyalog")
+        if stats["skipped"] > 0:
+            print(f"Atlandı: {stats['skipped']} satır")
         
         print(f"Çıktı dosyası kaydedildi: {output_file}")
-        print(f"Toplam diyalog sayısı: {len(normalized_lines)}")
+        print(f"Toplam diyalog sayısı: {stats['normalized']}")
+        
+        # Her çıktı satırı ya _P_ALL eşleşmesinden (user: ... assistant: ... içerir) ya da
+        # Format 2 için "user: ... assistant:" kalıbıyla üretilir; geçersiz satır yazılmaz
+        return stats["normalized"], 0
         
     except FileNotFoundError as e:
         print(f"HATA: {e}")
@@ -196,10 +284,20 @@ def normalize_lora_data(input_file: str, output_file: str) -> None:
         raise
 
 
+def print_validation_summary(valid_count: int, invalid_count: int) -> None:
+    """Doğrulama sonuçlarını yazdırır"""
+    print(f"\nDoğrulama sonuçları:")
+    print(f"  Geçerli diyalog: {valid_count}")
+    print(f"  Geçersiz satır: {invalid_count}")
+
+
 def validate_normalized_data(output_file: str) -> None:
     """
     Normalize edilmiş veriyi doğrular
     
+    Dışarıdan gelen dosyalar içindir; normalize_lora_data() sonuçları
+    zaten yazma sırasında doğrular.
+    
     Args:
         output_file: Doğrulanacak dosya yolu
     """
@@ -215,19 +313,14 @@ def validate_normalized_data(output_file: str) -> None:
             if not line:
                 continue
             
-            # Her satırda "user:" ve "assistant:" olmalı
-            has_user = 'user:' in line.lower()
-            has_assistant = 'assistant:' in line.lower()
-            
-            if has_user and has_assistant:
+            # Her satırda "user:" ve "assistant:" olmalı (satır küçük harfe kopyalanmadan tek aramada)
+            if _HAS_BOTH.search(line):
                 valid_count += 1
             else:
                 invalid_count += 1
                 print(f"Uyarı - Satır {i}: Geçersiz format: {line[:50]}...")
         
-        print(f"\nDoğrulama sonuçları:")
-        print(f"  Geçerli diyalog: {valid_count}")
-        print(f"  Geçersiz satır: {invalid_count}")
+        print_validation_summary(valid_count, invalid_count)
         
     except Exception as e:
         print(f"Doğrulama hatası: {e}")
@@ -245,14 +338,14 @@ if __name__ == "__main__":
     print("=" * 60)
     
     try:
-        # Normalizasyon işlemini başlat
-        normalize_lora_data(input_file, output_file)
+        # Normalizasyon işlemini başlat (doğrulama yazma sırasında yapılır)
+        valid_count, invalid_count = normalize_lora_data(input_file, output_file)
         
-        # Doğrulama yap
+        # Doğrulama sonuçları
         print("\n" + "=" * 60)
         print("Doğrulama İşlemi")
         print("=" * 60)
-        validate_normalized_data(output_file)
+        print_validation_summary(valid_count, invalid_count)
         
         print("\n" + "=" * 60)
         print("İşlem tamamlandı!")
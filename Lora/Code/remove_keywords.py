@@ -3,9 +3,27 @@ Kahve ve müzik içeren diyalogların yarısını final.json'dan silen script.
 """
 
 import json
+import multiprocessing
+import os
 import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+# Opsiyonel: orjson varsa JSON okuma/yazma C tabanlı kütüphaneyle yapılır
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Opsiyonel: pyahocorasick varsa tüm keyword'ler tek bir otomatla, metin başına tek geçişte aranır
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 # Dinamik dosya yolları - Script'in bulunduğu klasöre göre otomatik ayarlanır
 SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -16,10 +34,88 @@ DATA_DIR = PROJECT_ROOT / "Lora" / "Data"
 INPUT_FILE = DATA_DIR / "final.json"
 BACKUP_FILE = DATA_DIR / "finalbackup2.json"
 
+# JSON yazma tamponu (1 MiB)
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Aho-Corasick otomatı bu kadar (ve daha fazla) farklı keyword olduğunda kullanılır;
+# birkaç keyword'de önbelleğe alınmış küçük harfli metinde `in` araması daha hızlıdır
+AHOCORASICK_MIN_KEYWORDS = 8
+
+# Bu sayıdan büyük verisetlerinde keyword taraması süreç havuzunda paralel yapılır
+# (küçük verilerde süreç başlatma maliyeti kazançtan büyüktür)
+PARALLEL_SCAN_MIN_ITEMS = 200_000
+
+# Paralel taramada veri worker'lara pickle ile gönderilmez: fork edilen süreçler bu global'i
+# ebeveynden miras alır, worker'lara sadece (başlangıç, bitiş) index aralığı gönderilir
+_SCAN_DATA: Optional[List[Dict[str, str]]] = None
+
+def load_json(path: Path):
+    """
+    JSON dosyasını okur (orjson varsa onunla, yoksa standart json ile).
+    
+    Args:
+        path: Okunacak JSON dosyası
+        
+    Returns:
+        Parse edilmiş JSON verisi
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def dump_json(data, path: Path) -> None:
+    """
+    Veriyi 2 boşluk girintili, ASCII'ye kaçırılmamış JSON olarak yazar.
+    
+    Önce aynı klasördeki geçici dosyaya yazılır, sonra os.replace ile hedefin
+    yerine atomik olarak taşınır; yazma yarıda kalırsa mevcut dosya bozulmaz.
+    
+    Args:
+        data: Yazılacak veri
+        path: Hedef dosya yolu
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        if ORJSON_AVAILABLE:
+            with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Yarım kalan geçici dosyayı temizle, hedef dosyaya dokunma
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def fold_case(text: str) -> str:
+    """
+    Büyük/küçük harf duyarsız arama için metni küçük harfe çevirir.
+    
+    Python'da 'İ'.lower() iki karakterlik 'i̇' (i + birleşik nokta) üretir;
+    birleşik nokta 'i'den sonraki harfle araya girdiği için "BİR" gibi metinler
+    'bir' gibi 'i'yi ortasında içeren keyword aramalarında kaçar ('bi̇r').
+    'İ' önce düz 'i'ye çevrilir, geri kalan dönüşüm str.lower() ile C
+    seviyesinde yapılır.
+    
+    Args:
+        text: Dönüştürülecek metin
+        
+    Returns:
+        str: Küçük harfli metin
+    """
+    if 'İ' in text:
+        text = text.replace('İ', 'i')
+    return text.lower()
+
 def contains_keyword(item: Dict[str, str], keyword: str) -> bool:
     """
     Bir diyalogun user veya assistant mesajında belirtilen anahtar kelimeyi içerip içermediğini kontrol eder.
     
+    Tek diyalog kontrolü içindir; toplu taramada find_keyword_matches() kullanılır
+    (orada metin her diyalog için bir kez küçük harfe çevrilir).
+    
     Args:
         item: {"user": "...", "assistant": "..."} formatında bir diyalog
         keyword: Aranacak anahtar kelime
@@ -31,10 +127,120 @@ def contains_keyword(item: Dict[str, str], keyword: str) -> bool:
         return False
     
     # Hem user hem assistant mesajlarını birleştir ve küçük harfe çevir (case-insensitive arama için)
-    combined_text = (item.get('user', '') + ' ' + item.get('assistant', '')).lower()
+    combined_text = fold_case(item.get('user', '') + ' ' + item.get('assistant', ''))
     
     # Anahtar kelimeyi kontrol et
-    return keyword.lower() in combined_text
+    return fold_case(keyword) in combined_text
+
+def _scan_chunk(start: int, items: List[Dict[str, str]], keywords: List[str]) -> Dict[str, List[int]]:
+    """
+    Bir diyalog dilimini tarar; index'ler dilim başlangıcına göre kaydırılmış döner.
+    
+    Her diyalogun birleşik küçük harfli metni bir kez hesaplanır ve tüm
+    keyword'ler aynı metin üzerinde aranır. pyahocorasick kuruluysa ve en az
+    AHOCORASICK_MIN_KEYWORDS keyword varsa arama
+    Aho-Corasick otomatıyla metin başına tek taramada yapılır.
+    
+    Args:
+        start: Dilimin data içindeki başlangıç index'i
+        items: Taranacak diyaloglar
+        keywords: Aranacak anahtar kelimeler
+        
+    Returns:
+        Dict[str, List[int]]: keyword -> artan sırada (global) diyalog index'leri
+    """
+    keyword_matches = {keyword: [] for keyword in keywords}
+    
+    # Aynı küçük harfli karşılığa sahip keyword'ler birlikte raporlanır
+    by_lower: Dict[str, List[str]] = {}
+    for keyword in keyword_matches:
+        by_lower.setdefault(fold_case(keyword), []).append(keyword)
+    
+    automaton = None
+    if AHOCORASICK_AVAILABLE and len(by_lower) >= AHOCORASICK_MIN_KEYWORDS and all(by_lower):
+        automaton = ahocorasick.Automaton()
+        for keyword_lower, originals in by_lower.items():
+            automaton.add_word(keyword_lower, originals)
+        automaton.make_automaton()
+    
+    for idx, item in enumerate(items, start):
+        if not isinstance(item, dict) or 'user' not in item or 'assistant' not in item:
+            continue
+        combined_text = fold_case(item['user'] + ' ' + item['assistant'])
+        
+        if automaton is not None:
+            for _, originals in automaton.iter(combined_text):
+                for keyword in originals:
+                    hits = keyword_matches[keyword]
+                    # Aynı keyword metinde birden fazla geçebilir, index bir kez eklenir
+                    if not hits or hits[-1] != idx:
+                        hits.append(idx)
+        else:
+            for keyword_lower, originals in by_lower.items():
+                if keyword_lower in combined_text:
+                    for keyword in originals:
+                        keyword_matches[keyword].append(idx)
+    
+    return keyword_matches
+
+def _scan_range(start: int, end: int, keywords: List[str]) -> Dict[str, List[int]]:
+    """
+    Fork ile miras alınan _SCAN_DATA'nın [start, end) aralığını tarar (süreç havuzu worker'ı).
+    
+    Args:
+        start: Aralığın başlangıç index'i
+        end: Aralığın bitiş index'i (dahil değil)
+        keywords: Aranacak anahtar kelimeler
+        
+    Returns:
+        Dict[str, List[int]]: keyword -> artan sırada (global) diyalog index'leri
+    """
+    return _scan_chunk(start, _SCAN_DATA[start:end], keywords)
+
+def find_keyword_matches(data: List[Dict[str, str]], keywords: List[str], workers: Optional[int] = None) -> Dict[str, List[int]]:
+    """
+    Her keyword'ü içeren diyalogların index'lerini tek geçişte bulur.
+    
+    Büyük verisetlerinde (PARALLEL_SCAN_MIN_ITEMS ve üzeri) veri CPU sayısı
+    kadar aralığa bölünür ve aralıklar fork edilen süreçlerde taranır. Veri
+    süreçlere kopyalanmaz (fork ile miras alınır); fork desteklenmeyen
+    platformlarda (Windows) veriyi pickle'lamak seri taramadan yavaş olduğu
+    için tarama seri yapılır.
+    
+    Args:
+        data: JSON verisi (diyalog listesi)
+        keywords: Aranacak anahtar kelimeler
+        workers: Süreç sayısı (None ise veri boyutuna ve CPU sayısına göre seçilir)
+        
+    Returns:
+        Dict[str, List[int]]: keyword -> artan sırada diyalog index'leri
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(data) >= PARALLEL_SCAN_MIN_ITEMS else 1
+    
+    if workers <= 1 or len(data) < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return _scan_chunk(0, data, keywords)
+    
+    global _SCAN_DATA
+    chunk_size = -(-len(data) // workers)  # Yukarı yuvarlanmış bölme
+    keyword_matches = {keyword: [] for keyword in keywords}
+    
+    # Global, havuz (ve worker süreçleri) oluşturulmadan önce atanmalı ki fork ile miras alınsın
+    _SCAN_DATA = data
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = [
+                executor.submit(_scan_range, start, min(start + chunk_size, len(data)), keywords)
+                for start in range(0, len(data), chunk_size)
+            ]
+            # Aralıklar sırayla birleştirilir; index listeleri artan sırada kalır
+            for future in futures:
+                for keyword, hits in future.result().items():
+                    keyword_matches[keyword].extend(hits)
+    finally:
+        _SCAN_DATA = None
+    
+    return keyword_matches
 
 def remove_keyword_entries(data: List[Dict[str, str]], keywords: List[str], remove_ratio: float = 0.5) -> tuple:
     """
@@ -48,20 +254,20 @@ def remove_keyword_entries(data: List[Dict[str, str]], keywords: List[str], remo
     Returns:
         tuple: (temizlenmiş veri, toplam kaldırılan diyalog sayısı, keyword bazında istatistikler)
     """
-    # Silinecek index'leri tutacak set (bir diyalog birden fazla keyword içeriyorsa sadece bir kere silinir)
-    indices_to_remove = set()
+    # Silinecek index'leri işaretleyen bayt maskesi (1 = silinecek)
+    # Bir diyalog birden fazla keyword içeriyorsa sadece bir kere silinir
+    remove_mask = bytearray(len(data))
     
     # Her keyword için istatistik tut
     keyword_stats = {}
     
+    # Tek geçişte tüm keyword'lerin geçtiği diyalog index'lerini bul
+    keyword_matches = find_keyword_matches(data, keywords)
+    
     # Her keyword için ayrı ayrı işlem yap
     for keyword in keywords:
-        # Bu keyword'ü içeren diyalogları bul
-        matching_indices = []
-        for idx, item in enumerate(data):
-            # Eğer bu diyalog daha önce silinmediyse kontrol et
-            if idx not in indices_to_remove and contains_keyword(item, keyword):
-                matching_indices.append(idx)
+        # Bu keyword'ü içeren diyaloglardan daha önce silinmek üzere seçilmemiş olanlar
+        matching_indices = [idx for idx in keyword_matches[keyword] if not remove_mask[idx]]
         
         matching_count = len(matching_indices)
         print(f"[FIND] '{keyword}' içeren {matching_count} diyalog bulundu")
@@ -70,21 +276,27 @@ def remove_keyword_entries(data: List[Dict[str, str]], keywords: List[str], remo
             keyword_stats[keyword] = {'total': 0, 'removed': 0}
             continue
         
-        # Kaldırılacak diyalog sayısını hesapla (tam sayıya yuvarla, en az 1)
-        num_to_remove = max(1, int(matching_count * remove_ratio))
+        # Kaldırılacak diyalog sayısını hesapla (aşağı yuvarla, en az 1, en fazla eşleşen sayısı)
+        num_to_remove = min(matching_count, max(1, int(matching_count * remove_ratio)))
         
-        # Rastgele olarak seçilen diyalogların index'lerini al
-        # Her keyword için farklı seed kullan (keyword'ün hash değerine göre)
-        keyword_seed = hash(keyword) % (2**32)  # Hash'i 32-bit integer'a çevir
-        random.seed(keyword_seed)  # Her keyword için tutarlı ama farklı seed
-        selected_indices = random.sample(matching_indices, num_to_remove)
-        indices_to_remove.update(selected_indices)
+        if num_to_remove == matching_count:
+            # Eşleşenlerin hepsi silinecek; rastgele seçim (tam karıştırma) gereksiz
+            selected_indices = matching_indices
+        else:
+            # Rastgele olarak seçilen diyalogların index'lerini al
+            # Her keyword için farklı seed kullan (keyword'ün hash değerine göre)
+            # Yerel Random örneği kullanılır; global random durumu değiştirilmez
+            keyword_seed = hash(keyword) & 0xFFFFFFFF  # Hash'i 32-bit integer'a çevir
+            rng = random.Random(keyword_seed)  # Her keyword için tutarlı ama farklı seed
+            selected_indices = rng.sample(matching_indices, num_to_remove)
+        for idx in selected_indices:
+            remove_mask[idx] = 1
         
         keyword_stats[keyword] = {'total': matching_count, 'removed': num_to_remove}
         print(f"[REMOVE] '{keyword}' için {num_to_remove} diyalog seçildi (toplam {matching_count} içinden)")
     
     # Kaldırılacak diyalogları filtrele
-    cleaned_data = [item for idx, item in enumerate(data) if idx not in indices_to_remove]
+    cleaned_data = [item for item, removed in zip(data, remove_mask) if not removed]
     total_removed = len(data) - len(cleaned_data)
     
     return cleaned_data, total_removed, keyword_stats
@@ -109,8 +321,7 @@ def main():
     try:
         # JSON dosyasını oku
         print(f"[READ] JSON dosyası okunuyor: {INPUT_FILE}")
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json(INPUT_FILE)
         
         if not isinstance(data, list):
             print(f"[ERROR] JSON dosyası array formatında olmalı, alınan tip: {type(data)}")
@@ -120,10 +331,9 @@ def main():
         print(f"[READ] Toplam {original_count} diyalog okundu")
         print()
         
-        # Yedek oluştur (güvenlik için)
+        # Yedek oluştur (güvenlik için) - veri yeniden serialize edilmez, dosya bayt bayt kopyalanır
         print(f"[BACKUP] Yedek dosyası oluşturuluyor: {BACKUP_FILE}")
-        with open(BACKUP_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        shutil.copyfile(INPUT_FILE, BACKUP_FILE)
         print(f"[BACKUP] Yedek dosyası oluşturuldu")
         print()
         
@@ -144,8 +354,7 @@ def main():
         
         # Temizlenmiş veriyi dosyaya yaz
         print(f"[WRITE] Temizlenmiş veri dosyaya yazılıyor: {INPUT_FILE}")
-        with open(INPUT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
+        dump_json(cleaned_data, INPUT_FILE)
         print(f"[WRITE] Dosya başarıyla güncellendi")
         print()
         
@@ -2,26 +2,78 @@
 
 import sys
 import json
+import hashlib
 import random
 import os
 import time
+import dataclasses
 from pathlib import Path
 from datetime import datetime
+
+# Hugging Face ortam ayarları - kütüphaneler import edilmeden önce atanmalı (dışarıdan verilen değerler korunur)
+# Tokenization paralelliği datasets.map(num_proc) süreçlerinden gelir; Rust tokenizer'ın kendi thread
+# havuzu kapatılır, böylece fork edilen süreçlerde uyarı/kilitlenme olmaz
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+os.environ.setdefault("TRANSFORMERS_VERBOSITY", "error")
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer, DataCollatorForLanguageModeling
-from peft import LoraConfig, get_peft_model, TaskType
-from datasets import Dataset
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer, DataCollatorForLanguageModeling, BitsAndBytesConfig, EarlyStoppingCallback
+from peft import LoraConfig, get_peft_model, TaskType, prepare_model_for_kbit_training
+from datasets import Dataset, DatasetDict, Sequence, Value, load_from_disk
+import pyarrow as pa
 import numpy as np
 
+# Opsiyonel: bitsandbytes varsa optimizer durumları 8-bit (paged AdamW) tutulur
+try:
+    import bitsandbytes  # noqa: F401
+    BITSANDBYTES_AVAILABLE = True
+except ImportError:
+    BITSANDBYTES_AVAILABLE = False
+
+# Opsiyonel: flash-attn varsa GPU'da attention Flash-Attention 2 kernel'i ile hesaplanır
+try:
+    import flash_attn  # noqa: F401
+    FLASH_ATTN_AVAILABLE = True
+except ImportError:
+    FLASH_ATTN_AVAILABLE = False
+
+# Opsiyonel: ijson varsa JSON veri dosyası tamamı belleğe alınmadan akış halinde okunur
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# Opsiyonel: ijson yoksa JSON tek seferde orjson (C/Rust tabanlı) ile, o da yoksa standart json ile okunur
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# TrainingArguments.accelerator_config'in "non_blocking" alanı transformers'ın daha yeni sürümlerinde var;
+# eski sürümlerde bilinmeyen anahtar hata verdiğinden sadece destekleniyorsa verilir
+try:
+    from transformers.trainer_pt_utils import AcceleratorConfig
+    ACCELERATOR_NON_BLOCKING = any(f.name == "non_blocking" for f in dataclasses.fields(AcceleratorConfig))
+except ImportError:
+    ACCELERATOR_NON_BLOCKING = False
+
 # Tekrarlanabilirlik için global seed değeri
 DEFAULT_SEED = 42
 
+# STRICT_DETERMINISM=1 ile CuDNN deterministik mod açılır (birebir tekrarlanabilir ama daha yavaş);
+# varsayılan olarak TF32, cuDNN autotuner ve flash/mem-efficient SDPA kernel'leri kullanılır
+STRICT_DETERMINISM = os.environ.get("STRICT_DETERMINISM", "0").strip().lower() in ("1", "true", "yes")
+
 os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
 
 def set_global_seed(seed: int = DEFAULT_SEED):
     """Tekrarlanabilirlik için tüm rastgelelik kaynaklarını kilitle.
     - Python random, NumPy ve PyTorch (CPU/GPU) seed ataması yapılır
-    - CUDA/CuDNN deterministik mod etkinleştirilir (varsa)
+    - STRICT_DETERMINISM açıksa CUDA/CuDNN deterministik mod etkinleştirilir (varsa),
+      kapalıysa hızlı kernel'ler (TF32, cuDNN benchmark, flash SDPA) etkinleştirilir
     Not: Deterministik mod bazı operasyonları yavaşlatabilir ama tutarlılık sağlar
     """
     try:
@@ -34,9 +86,17 @@ def set_global_seed(seed: int = DEFAULT_SEED):
         # PyTorch CUDA (mevcutsa tüm GPU'lar)
         if torch.cuda.is_available():
             torch.cuda.manual_seed_all(seed)
-            # Deterministik ve benchmark ayarları
-            torch.backends.cudnn.deterministic = True
-            torch.backends.cudnn.benchmark = False
+            if STRICT_DETERMINISM:
+                # Deterministik ve benchmark ayarları
+                torch.backends.cudnn.deterministic = True
+                torch.backends.cudnn.benchmark = False
+            else:
+                # Hızlı yol: TF32 matmul/conv, cuDNN autotuner ve fused attention kernel'leri
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                torch.backends.cudnn.benchmark = True
+                torch.backends.cuda.enable_flash_sdp(True)
+                torch.backends.cuda.enable_mem_efficient_sdp(True)
     except Exception as e:
         # Seed ataması başarısız olursa süreci durdurma, ancak uyarı ver
         print(f"[SEED] Uyarı: Seed ayarlanırken hata oluştu: {e}")
@@ -58,32 +118,119 @@ if not (DATA_DIR / "final.json").exists():
 OUTPUT_MODEL_DIR = MODEL_DIR / "lora-turkish-gpt2-medium"
 REPORT_FILE = DATA_DIR / "training_report.txt"
 
+# Tokenization ayarları - Rust (fast) tokenizer büyük batch'lerde çok daha hızlıdır,
+# num_proc ile dataset parçaları ayrı süreçlerde tokenize edilir
+TOKENIZE_BATCH_SIZE = 4096
+TOKENIZE_NUM_PROC = min(8, os.cpu_count() or 1)
+
+# Tokenize edilmiş train/validation setleri Arrow formatında burada saklanır;
+# aynı veri + tokenizer + ayarlar ile tekrar çalıştırıldığında tokenization atlanır
+TOKENIZED_CACHE_DIR = DATA_DIR / "tokenized_cache"
+# Önbellekteki sütun yapısı değiştiğinde artırılır (eski önbellekler yeniden kullanılmaz)
+TOKENIZED_CACHE_VERSION = 3
+
+# Dağıtık eğitim (torchrun --nproc_per_node=N) - değişkenler torchrun tarafından atanır,
+# tek süreçte çalıştırıldığında LOCAL_RANK=-1, WORLD_SIZE=1 olur
+LOCAL_RANK = int(os.environ.get("LOCAL_RANK", -1))
+RANK = int(os.environ.get("RANK", 0))
+WORLD_SIZE = int(os.environ.get("WORLD_SIZE", 1))
+IS_MAIN_PROCESS = RANK == 0
+
+# bf16 desteği (Ampere/Ada ve üstü); desteklenmeyen GPU'larda fp16'ya düşülür
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+
+# Attention backend - QK^T, softmax ve V çarpımı tek fused kernel'de yapılır (L×L matris belleğe yazılmaz);
+# GPU'da flash-attn kuruluysa Flash-Attention 2, değilse PyTorch SDPA
+ATTN_IMPLEMENTATION = "flash_attention_2" if (torch.cuda.is_available() and FLASH_ATTN_AVAILABLE) else "sdpa"
+
+# QLoRA - GPU'da bitsandbytes varsa dondurulmuş base model 4-bit NF4 olarak yüklenir
+# (ağırlık belleği ~4x azalır), LoRA adapter'ları bf16/fp16 hesaplanır
+USE_4BIT = torch.cuda.is_available() and BITSANDBYTES_AVAILABLE
+
+# torch.compile (Inductor + CUDA graph) - sadece GPU'da; bitsandbytes 4-bit katmanları
+# CUDA graph'larla (reduce-overhead) uyumlu olmadığından QLoRA'da kapalı
+USE_TORCH_COMPILE = torch.cuda.is_available() and hasattr(torch, "compile") and not USE_4BIT
+# Derlenmiş modelde sekanslar 128'in katına pad'lenir; max_length=512'de en fazla 4 farklı
+# şekil (128/256/384/512) oluşur ve her biri için graph bir kez derlenip tekrar kullanılır
+COMPILE_PAD_MULTIPLE = 128
+
+# Optimizer - GPU'da bitsandbytes varsa 8-bit paged AdamW (Adam momentleri int8, ~4x daha az bellek),
+# yoksa fused AdamW; CPU'da standart AdamW
+if torch.cuda.is_available():
+    OPTIMIZER = "paged_adamw_8bit" if BITSANDBYTES_AVAILABLE else "adamw_torch_fused"
+else:
+    OPTIMIZER = "adamw_torch"
 
-def load_dataset_from_file(file_path: Path, limit: int = None) -> list:
+# DataLoader worker sayısı - 0 ise batch'ler ana süreçte hazırlanır
+DATALOADER_NUM_WORKERS = min(4, (os.cpu_count() or 1) // 2)
+# Her worker'ın önceden hazırladığı batch sayısı (GPU bir adımı işlerken sonraki batch'ler collate edilir)
+DATALOADER_PREFETCH_FACTOR = 4
+
+
+# "user: {u} assistant: {a}" formatında mesajlar dışında kalan sabit karakter sayısı
+CONVERSATION_FORMAT_OVERHEAD = len("user:  assistant: ")
+
+def load_dataset_from_file(file_path: Path, limit: int = None) -> dict:
     """
-    Veri dosyasını (final.txt veya final.json) okur ve diyalog listesi döndürür.
+    Veri dosyasını (final.txt veya final.json) okur ve diyalogları sütunlar halinde döndürür.
     JSON formatı: [{"user": "...", "assistant": "..."}, ...]
     TXT formatı: Her satır "user: ... assistant: ..." formatında
     
+    JSON'da mesajlar ayrı "user"/"assistant" sütunlarında tutulur; birleşik metin
+    ara liste olarak oluşturulmaz, tokenization sırasında batch bazında üretilir.
+    
     Args:
         file_path: Okunacak veri dosyası yolu
         limit: Eğer belirtilirse, sadece ilk N satırı alır (test modu için)
         
     Returns:
-        list: Diyalog listesi (her öğe "user: ... assistant: ..." formatında)
+        dict: JSON için {"user": [...], "assistant": [...]},
+              TXT için {"text": [...]} (her öğe "user: ... assistant: ..." formatında)
     """
     if not file_path.exists():
         raise FileNotFoundError(f"Veri dosyası bulunamadı: {file_path}")
     
-    conversations = []
     file_ext = file_path.suffix.lower()
     
     try:
-        # JSON dosyası ise
-        if file_ext == '.json':
+        # JSON dosyası ise - ijson ile akış halinde (dict listesi ara adım olarak oluşturulmaz)
+        if file_ext == '.json' and IJSON_AVAILABLE:
+            print(f"[LOAD] JSON dosyası akış halinde okunuyor: {file_path}")
+            users, assistants = [], []
+            if limit is not None and limit > 0:
+                print(f"[LOAD] Test modu: JSON'dan sadece ilk {limit} satır alınıyor...")
+                # Listeler önceden boyutlandırılır, sonda kullanılmayan kısım kırpılır
+                users, assistants = [None] * limit, [None] * limit
+            count = 0
+            with open(file_path, 'rb') as f:
+                for item in ijson.items(f, 'item'):
+                    if isinstance(item, dict) and 'user' in item and 'assistant' in item:
+                        if limit is not None and limit > 0:
+                            users[count] = str(item['user'])
+                            assistants[count] = str(item['assistant'])
+                            count += 1
+                            if count >= limit:
+                                break
+                        else:
+                            users.append(str(item['user']))
+                            assistants.append(str(item['assistant']))
+                    else:
+                        print(f"[WARNING] Geçersiz JSON objesi atlandı: {item}")
+            if limit is not None and limit > 0:
+                del users[count:], assistants[count:]
+            
+            columns = {"user": users, "assistant": assistants}
+            print(f"[LOAD] JSON'dan {len(users)} diyalog okundu")
+        
+        # JSON dosyası ise (ijson yoksa tamamı tek seferde yüklenir)
+        elif file_ext == '.json':
             print(f"[LOAD] JSON dosyası okunuyor: {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if ORJSON_AVAILABLE:
+                # orjson.JSONDecodeError, json.JSONDecodeError'ın alt sınıfıdır (aşağıda aynı şekilde yakalanır)
+                data = orjson.loads(file_path.read_bytes())
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             
             # JSON array kontrolü
             if not isinstance(data, list):
@@ -94,19 +241,22 @@ def load_dataset_from_file(file_path: Path, limit: int = None) -> list:
                 data = data[:limit]
                 print(f"[LOAD] Test modu: JSON'dan sadece ilk {limit} satır alınıyor...")
             
-            # Her JSON objesini "user: ... assistant: ..." formatına çevir
+            # Geçerli JSON objelerinin mesajlarını sütunlara ayır
+            users, assistants = [], []
             for item in data:
                 if isinstance(item, dict) and 'user' in item and 'assistant' in item:
-                    formatted_line = f"user: {item['user']} assistant: {item['assistant']}"
-                    conversations.append(formatted_line)
+                    users.append(str(item['user']))
+                    assistants.append(str(item['assistant']))
                 else:
                     print(f"[WARNING] Geçersiz JSON objesi atlandı: {item}")
             
-            print(f"[LOAD] JSON'dan {len(conversations)} diyalog okundu")
+            columns = {"user": users, "assistant": assistants}
+            print(f"[LOAD] JSON'dan {len(users)} diyalog okundu")
         
         # TXT dosyası ise (eski format)
         else:
             print(f"[LOAD] TXT dosyası okunuyor: {file_path}")
+            conversations = []
             total_lines = 0
             empty_lines = 0
             
@@ -125,23 +275,45 @@ def load_dataset_from_file(file_path: Path, limit: int = None) -> list:
                     else:
                         empty_lines += 1
             
+            columns = {"text": conversations}
             print(f"[LOAD] TXT'den {len(conversations)} diyalog okundu (Toplam satır: {total_lines}, Boş: {empty_lines})")
         
     except json.JSONDecodeError as e:
         raise Exception(f"JSON parse hatası: {e}")
     except Exception as e:
+        if IJSON_AVAILABLE and isinstance(e, ijson.JSONError):
+            raise Exception(f"JSON parse hatası: {e}")
         raise Exception(f"Dosya okuma hatası: {e}")
     
-    if len(conversations) == 0:
+    total = len(next(iter(columns.values())))
+    if total == 0:
         raise ValueError(f"Dosyada geçerli diyalog bulunamadı: {file_path}")
     
-    print(f"[LOAD] Toplam {len(conversations)} diyalog yüklendi")
-    return conversations
+    print(f"[LOAD] Toplam {total} diyalog yüklendi")
+    return columns
+
+def conversation_lengths(columns: dict) -> np.ndarray:
+    """
+    load_dataset_from_file çıktısındaki her diyalogun biçimlendirilmiş metin uzunluğunu
+    (karakter) int32 dizisi olarak döndürür; birleşik metinler oluşturulmaz.
+    """
+    if "text" in columns:
+        return np.fromiter((len(text) for text in columns["text"]), dtype=np.int32, count=len(columns["text"]))
+    lengths = np.fromiter(
+        (len(u) + len(a) for u, a in zip(columns["user"], columns["assistant"])),
+        dtype=np.int32, count=len(columns["user"])
+    )
+    return lengths + CONVERSATION_FORMAT_OVERHEAD
 
-def prepare_tokenized_dataset(tokenizer, conversations: list, max_length: int = 512, test_size: float = 0.05):
+def prepare_tokenized_dataset(tokenizer, conversations: dict, max_length: int = 512, test_size: float = 0.05, cache_key: str = None):
     """
     Konuşmaları tokenize eder ve train/validation split yapar.
     Padding='max_length' kullanarak tüm örnekleri sabit uzunlukta yapar.
+    conversations, load_dataset_from_file'ın döndürdüğü sütun sözlüğüdür.
+    
+    cache_key verilirse (veri dosyasını ve limiti tanımlayan metin) sonuç
+    TOKENIZED_CACHE_DIR altına kaydedilir; tokenizer, max_length ve test_size
+    aynıyken sonraki çalıştırmalarda diskten (memory-mapped) yüklenir.
     """
     def tokenize_function(examples):
         """
@@ -151,21 +323,56 @@ def prepare_tokenized_dataset(tokenizer, conversations: list, max_length: int =
         """
         # Sadece truncation yap, padding'i DataCollator'a bırak (dinamik padding için verimlilik artışı)
         # Labels'ı burada set etmeyelim, DataCollator otomatik oluşturacak (nesting sorununu önler)
-        tokens = tokenizer(examples["text"], truncation=True, max_length=max_length)
+        # JSON verisinde "user: ... assistant: ..." metni sadece bu batch için oluşturulur
+        if "text" in examples:
+            texts = examples["text"]
+        else:
+            texts = [f"user: {u} assistant: {a}" for u, a in zip(examples["user"], examples["assistant"])]
+        tokens = tokenizer(texts, truncation=True, max_length=max_length)
+        # Uzunluk sütunu group_by_length sampler'ı için (benzer uzunluktaki örnekler aynı batch'e düşer)
+        tokens["length"] = [len(ids) for ids in tokens["input_ids"]]
         return tokens
     
     # Dataset oluştur ve train/validation split yap
-    # Seed'i sabit 42 olarak ayarla (tekrarlanabilirlik için)
+    # Split seed'i train_test_split'e açıkça verilir; global RNG'ler burada yeniden seed'lenmez
+    # (global seed ataması set_global_seed'in işidir)
     random_seed = 42  # Sabit seed (tekrarlanabilirlik için)
-    random.seed(random_seed)  # Python random modülünü seed'le
-    dataset = Dataset.from_dict({"text": conversations})
-    dataset = dataset.train_test_split(test_size=test_size, shuffle=True, seed=random_seed)
-    train_dict, eval_dict = dataset["train"], dataset["test"]
-    print(f"[DATASET] Train: {len(train_dict)}, Validation: {len(eval_dict)} ({test_size*100:.1f}%)")
     
-    # Tokenization uygula - batched mode ile daha hızlı işleme
-    train_tokenized = train_dict.map(tokenize_function, batched=True, remove_columns=train_dict.column_names)
-    eval_tokenized = eval_dict.map(tokenize_function, batched=True, remove_columns=eval_dict.column_names)
+    # Önbellek kontrolü - parmak izi veri + tokenizer + tüm tokenization/split ayarlarını kapsar
+    cache_dir = None
+    if cache_key is not None:
+        fingerprint_key = f"v{TOKENIZED_CACHE_VERSION}|{cache_key}|{tokenizer.name_or_path}|{len(tokenizer)}|{max_length}|{test_size}|{random_seed}"
+        cache_dir = TOKENIZED_CACHE_DIR / hashlib.md5(fingerprint_key.encode('utf-8')).hexdigest()
+        if cache_dir.exists():
+            try:
+                cached = load_from_disk(str(cache_dir))
+                print(f"[DATASET] Tokenize edilmiş veri önbellekten yüklendi: {cache_dir}")
+                print(f"[DATASET] Train: {len(cached['train'])}, Validation: {len(cached['test'])} ({test_size*100:.1f}%)")
+                return cached["train"], cached["test"]
+            except Exception as e:
+                print(f"[DATASET] Uyarı: Önbellek okunamadı, yeniden tokenize edilecek: {e}")
+    
+    # Sütun sözlüğü doğrudan Arrow tablosuna çevrilir (from_dict'in tip çıkarımı/kopyası atlanır)
+    dataset = Dataset(pa.Table.from_pydict(conversations))
+    
+    # Tokenization tüm veri üzerinde tek map ile uygulanır, split sonra yapılır
+    # (split yalnızca satır sayısı ve seed'e bağlı; ayrılan örnekler öncekiyle aynıdır)
+    # Büyük batch ve çoklu süreç ile daha hızlı işleme; tek çekirdekte süreç havuzu açılmaz (num_proc=None)
+    num_proc = TOKENIZE_NUM_PROC if TOKENIZE_NUM_PROC > 1 else None
+    tokenized = dataset.map(tokenize_function, batched=True, batch_size=TOKENIZE_BATCH_SIZE, writer_batch_size=TOKENIZE_BATCH_SIZE, num_proc=num_proc, remove_columns=dataset.column_names, load_from_cache_file=True)
+    # Token id'leri ve uzunluklar int64 yerine int32 saklanır (Arrow dosyası ve memory-map yarıya iner)
+    tokenized = tokenized.cast_column("input_ids", Sequence(Value("int32"))).cast_column("length", Value("int32"))
+    split = tokenized.train_test_split(test_size=test_size, shuffle=True, seed=random_seed)
+    train_tokenized, eval_tokenized = split["train"], split["test"]
+    print(f"[DATASET] Train: {len(train_tokenized)}, Validation: {len(eval_tokenized)} ({test_size*100:.1f}%)")
+    
+    # Sonucu önbelleğe yaz (hata olursa eğitim durdurulmaz)
+    if cache_dir is not None:
+        try:
+            DatasetDict({"train": train_tokenized, "test": eval_tokenized}).save_to_disk(str(cache_dir))
+            print(f"[DATASET] Tokenize edilmiş veri önbelleğe kaydedildi: {cache_dir}")
+        except Exception as e:
+            print(f"[DATASET] Uyarı: Önbelleğe yazılamadı: {e}")
     
     return train_tokenized, eval_tokenized
 
@@ -178,25 +385,49 @@ def setup_lora_model(model_name: str = "ytu-ce-cosmos/turkish-gpt2-large"):
     """
     print(f"[SETUP] Model yükleniyor: {model_name}")
     
-    # Tokenizer yükleme
+    # Tokenizer yükleme - fast (Rust) tokenizer tercih edilir
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
     except Exception as e:
         raise Exception(f"Tokenizer yüklenemedi: {model_name} - {e}")
     
     # Pad token yoksa ekle (BERT için gerekli olabilir)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token if hasattr(tokenizer, 'eos_token') and tokenizer.eos_token else tokenizer.add_special_tokens({'pad_token': '[PAD]'})
+    # Eğitimde padding sağa yapılır (CausalLM label hizalaması ve sabit kalıplı batch'ler için)
+    tokenizer.padding_side = "right"
     
     # Model tipini belirle (BERT/GPT-2) ve GPU kontrolü yap
     is_bert = "bert" in model_name.lower()
     use_gpu = torch.cuda.is_available()
     
-    # Model yükleme - GPU varsa float16, CPU'da float32 kullan
+    # Model yükleme - GPU varsa bf16 (desteklenmiyorsa fp16) ağırlıklar doğrudan GPU'ya yüklenir,
+    # CPU'da ara kopya oluşturulmaz; CPU'da float32 kullan
+    # USE_4BIT ise base model 4-bit NF4 (double quant) ile yüklenir, hesaplama gpu_dtype'ta yapılır
     try:
-        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float16 if use_gpu else torch.float32)
+        gpu_dtype = torch.bfloat16 if USE_BF16 else torch.float16
+        quantization_config = None
+        if USE_4BIT:
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=gpu_dtype,
+                bnb_4bit_use_double_quant=True
+            )
+        load_kwargs = dict(
+            torch_dtype=gpu_dtype if use_gpu else torch.float32,
+            device_map={"": max(LOCAL_RANK, 0)} if use_gpu else None,  # DDP'de her süreç kendi GPU'suna yükler
+            low_cpu_mem_usage=True,
+            quantization_config=quantization_config
+        )
+        try:
+            model = AutoModelForCausalLM.from_pretrained(model_name, attn_implementation=ATTN_IMPLEMENTATION, **load_kwargs)
+            print(f"[SETUP] Attention backend: {ATTN_IMPLEMENTATION}")
+        except (ValueError, ImportError) as e:
+            # Model mimarisi veya transformers sürümü bu backend'i desteklemiyorsa varsayılan attention kullanılır
+            print(f"[SETUP] Uyarı: {ATTN_IMPLEMENTATION} attention kullanılamadı, varsayılana dönülüyor: {e}")
+            model = AutoModelForCausalLM.from_pretrained(model_name, **load_kwargs)
         if use_gpu:
-            model = model.cuda()  # GPU'ya taşı
             print(f"[SETUP] GPU: {torch.cuda.get_device_name(0)}, CUDA: {torch.version.cuda}, Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB")
         else:
             print("[SETUP] CPU modunda (GPU bulunamadı - çok yavaş olacaktır)")
@@ -209,24 +440,133 @@ def setup_lora_model(model_name: str = "ytu-ce-cosmos/turkish-gpt2-large"):
     target_modules = ["query", "key", "value", "dense"] if is_bert else ["c_attn", "c_proj"]
     lora_config = LoraConfig(task_type=TaskType.CAUSAL_LM, r=16, lora_alpha=32, lora_dropout=0.05, target_modules=target_modules, bias="none")
     
+    # 4-bit modeli eğitime hazırla (layer norm'lar fp32'ye alınır); gradient checkpointing aşağıdaki
+    # gradient_checkpointing_enable çağrısıyla açılır (gradient_checkpointing_kwargs eski peft sürümlerinde yok)
+    if USE_4BIT:
+        model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=False)
+        print("[SETUP] Base model 4-bit NF4 olarak yüklendi (QLoRA)")
+    
     # LoRA adapter'ı model'e ekle
     model = get_peft_model(model, lora_config)
     model.print_trainable_parameters()
     
+    # Gradient checkpointing - base modelin aktivasyonları backward'da yeniden hesaplanır
+    # (~%30 ek hesaplama karşılığında aktivasyon belleği birkaç kat azalır, daha büyük batch sığar)
+    # Base model dondurulmuş olduğundan girişlerde requires_grad açılmalı; KV cache eğitimde kapatılır
+    model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+    model.enable_input_require_grads()
+    model.config.use_cache = False
+    
+    # torch.compile burada yapılmaz: model Trainer'a (TrainingArguments.torch_compile) derlenmemiş PeftModel
+    # olarak verilir. Böylece pick_batch_size'ın deneme forward/backward'ları her aday batch için yeniden
+    # derleme / CUDA graph yakalama tetiklemez, checkpoint kaydetme ve load_best_model_at_end de PeftModel
+    # üzerinde (OptimizedModule sarmalayıcısı olmadan) çalışır
+    if USE_TORCH_COMPILE:
+        torch._dynamo.config.cache_size_limit = 64
+        print(f"[SETUP] torch.compile eğitimde Trainer tarafından uygulanacak (mode=reduce-overhead, sekans kovaları: {COMPILE_PAD_MULTIPLE}'in katları)")
+    
     # Model adını kaydet (rapor için)
     if not hasattr(model, 'model_name'):
         model.model_name = model_name
     
     return model, tokenizer
 
-def train_model(model, tokenizer, train_dataset, output_dir: Path, num_epochs: int = 3, batch_size: int = 2, gradient_accumulation_steps: int = 4, model_name: str = None, eval_dataset=None, eval_strategy: str = "epoch"):
+def select_precision() -> str:
+    """
+    Eğitim hassasiyetini donanıma göre seçer: bf16 (Ampere/Ada+), fp16 (eski GPU'lar) veya fp32 (CPU).
+    TF32 matmul, set_global_seed içinde (STRICT_DETERMINISM kapalıyken) etkinleştirilir.
+    """
+    if USE_BF16:
+        return "bf16"
+    return "fp16" if torch.cuda.is_available() else "fp32"
+
+# VRAM'e göre otomatik batch seçiminde denenecek per-device batch size'lar ve sabit tutulan effective batch
+BATCH_SIZE_CANDIDATES = (1, 2, 4, 8, 16)
+TARGET_EFFECTIVE_BATCH = 32
+
+def pick_batch_size(model, tokenizer, max_length: int = 512, target_effective: int = TARGET_EFFECTIVE_BATCH, precision: str = None) -> tuple:
+    """
+    GPU'daki boş belleğe göre sığan en büyük per-device batch size'ı seçer.
+    
+    Adaylar önce kaba bir aktivasyon tahminiyle (2 * katman * hidden * seq_len * 2 bayt/örnek)
+    boş belleğe göre elenir, kalanlar arasında max_length uzunluğunda sahte bir
+    forward+backward ile ikili arama yapılır (OOM olan boyut elenir).
+    Effective batch (batch_size * grad_accum) target_effective'de sabit tutulur.
+    
+    Returns:
+        tuple: (batch_size, grad_accum)
+    """
+    if precision is None:
+        precision = select_precision()
+    
+    free_bytes, _ = torch.cuda.mem_get_info()
+    config = model.config
+    n_layers = getattr(config, "n_layer", None) or getattr(config, "num_hidden_layers", 12)
+    hidden = getattr(config, "n_embd", None) or getattr(config, "hidden_size", 768)
+    bytes_per_sample = 2 * n_layers * hidden * max_length * 2
+    candidates = [bs for bs in BATCH_SIZE_CANDIDATES if bs == 1 or bs * bytes_per_sample < free_bytes]
+    print(f"[BATCH] Boş GPU belleği: {free_bytes / 1024**3:.2f} GB, denenecek batch size'lar: {candidates}")
+    
+    autocast_dtype = torch.bfloat16 if precision == "bf16" else torch.float16
+    dummy_token_id = tokenizer.eos_token_id if tokenizer.eos_token_id is not None else 0
+    # Deneme her zaman derlenmemiş modülde yapılır (derlenmiş modelde her aday batch yeniden derlenir ve
+    # empty_cache'in boşaltmadığı CUDA graph bellek havuzları ayrılır, boş bellek ölçümü düşük çıkar)
+    model = getattr(model, "_orig_mod", model)
+    model.train()  # Gradient checkpointing sadece train modunda devrededir
+    
+    def fits(bs: int) -> bool:
+        input_ids = torch.full((bs, max_length), dummy_token_id, dtype=torch.long, device="cuda")
+        loss = None
+        try:
+            with torch.autocast("cuda", dtype=autocast_dtype, enabled=precision in ("bf16", "fp16")):
+                loss = model(input_ids=input_ids, labels=input_ids).loss
+            loss.backward()
+            return True
+        except torch.cuda.OutOfMemoryError:
+            return False
+        finally:
+            del input_ids, loss
+            model.zero_grad(set_to_none=True)
+            torch.cuda.empty_cache()
+    
+    best = candidates[0]
+    lo, hi = 0, len(candidates) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(candidates[mid]):
+            best = candidates[mid]
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    
+    grad_accum = max(1, target_effective // best)
+    return best, grad_accum
+
+class LengthDroppingCollator:
+    """
+    "length" sütununu (sadece group_by_length sampler'ı için) atıp kalan alanları
+    asıl collator'a veren sarmalayıcı; modele length argümanı gitmez.
+    DataLoader worker'larına aktarılabilmesi için modül seviyesinde sınıf olarak tanımlıdır.
+    """
+    def __init__(self, collator):
+        self.collator = collator
+    
+    def __call__(self, features):
+        return self.collator([{k: v for k, v in f.items() if k != "length"} for f in features])
+
+def train_model(model, tokenizer, train_dataset, output_dir: Path, num_epochs: int = 3, batch_size: int = 2, gradient_accumulation_steps: int = 4, model_name: str = None, eval_dataset=None, eval_strategy: str = "epoch", precision: str = None):
     """
     LoRA ile model eğitimi yapar.
     Validation set varsa her epoch sonunda değerlendirme yapar ve en iyi modeli yükler.
+    precision: "bf16", "fp16" veya "fp32" (None ise donanıma göre seçilir, bkz. select_precision).
+    fp16'da Trainer dinamik loss scaling (GradScaler) kullanır.
     """
+    if precision is None:
+        precision = select_precision()
     print(f"[TRAIN] Eğitim başlıyor...")
     print(f"[TRAIN] Epoch sayısı: {num_epochs}")
     print(f"[TRAIN] Batch size: {batch_size}")
+    print(f"[TRAIN] Precision: {precision}")
     print(f"[TRAIN] Dataset boyutu: {len(train_dataset)}")
     
     # Training arguments - RTX 4060 için bf16 kullan (fp16'dan daha iyi)
@@ -238,26 +578,61 @@ def train_model(model, tokenizer, train_dataset, output_dir: Path, num_epochs: i
         per_device_train_batch_size=batch_size,
         gradient_accumulation_steps=gradient_accumulation_steps, 
         learning_rate=2e-4, 
+        optim=OPTIMIZER,
+        gradient_checkpointing=True,
+        gradient_checkpointing_kwargs={"use_reentrant": False},
         warmup_ratio=0.1,  # Warmup ratio kullanılıyor (warmup_steps yerine)
         logging_steps=20,  # Her 20 step'te log
         lr_scheduler_type="cosine",  # Cosine learning rate scheduler
         eval_strategy=eval_strategy, 
         save_strategy=eval_strategy,  # Her epoch sonunda kaydet
+        # Checkpoint'lerde sadece model (PEFT modelinde yalnızca LoRA adapter'ı) safetensors olarak yazılır;
+        # optimizer/scheduler durumu kaydedilmez, diskte en iyi ve son checkpoint dışındakiler silinir
+        save_only_model=True,
+        save_safetensors=True,
+        save_total_limit=1,
         load_best_model_at_end=(eval_dataset is not None),
         metric_for_best_model="eval_loss" if eval_dataset is not None else None, 
         greater_is_better=False if eval_dataset is not None else None,
         logging_dir=str(output_dir / "logs"), 
         report_to=None, 
         remove_unused_columns=False,
-        fp16=False,  # bf16 kullanılıyor, fp16 kapatıldı
-        bf16=torch.cuda.is_available(),  # RTX 4060 için bf16 True (fp16'dan daha iyi)
+        group_by_length=True,  # Benzer uzunluktaki örnekler gruplanır, dinamik padding'de PAD token israfı azalır
+        length_column_name="length",
+        fp16=(precision == "fp16"),  # Sadece bf16 desteklemeyen GPU'larda
+        bf16=(precision == "bf16"),  # RTX 4060 için bf16 True (fp16'dan daha iyi)
         dataloader_pin_memory=torch.cuda.is_available(),
+        # Accelerate'in DataLoader'ı batch'i cihaza kendisi taşır; pinned memory ile bu kopya non_blocking yapılır
+        # ve bir önceki adımın hesaplamasıyla örtüşür
+        accelerator_config={"non_blocking": True} if ACCELERATOR_NON_BLOCKING else None,
+        # torch.compile - attention/MLP blokları ve küçük rank'lı LoRA matmul'ları birleştirilmiş kernel'lere derlenir;
+        # collator sekansları COMPILE_PAD_MULTIPLE kovalarına pad'ler, her kova sabit şekilli bir CUDA graph olarak
+        # derlenir (reduce-overhead ile kernel başlatma gecikmesi ortadan kalkar). Trainer sadece eğitim
+        # forward'ını derler, self.model PeftModel olarak kalır
+        torch_compile=USE_TORCH_COMPILE,
+        torch_compile_mode="reduce-overhead" if USE_TORCH_COMPILE else None,
+        dataloader_num_workers=DATALOADER_NUM_WORKERS,
+        dataloader_persistent_workers=DATALOADER_NUM_WORKERS > 0,  # Worker'lar epoch'lar arasında yeniden başlatılmaz
+        dataloader_prefetch_factor=DATALOADER_PREFETCH_FACTOR if DATALOADER_NUM_WORKERS > 0 else None,
+        ddp_find_unused_parameters=False,  # DDP: tüm LoRA parametreleri her adımda kullanılır, graf taraması gereksiz
+        ddp_bucket_cap_mb=50,  # DDP: gradyanlar 50 MB'lık kovalarla all-reduce edilir
+        # Not: gradient accumulation ara adımlarında Trainer (accelerate) modeli no_sync() içinde çalıştırır,
+        # all-reduce sadece optimizer adımından önceki son mikro adımda yapılır
         seed=DEFAULT_SEED  # Trainer içi rastgeleliği kilitle
     )
     
     # Data collator - CausalLM için mlm=False
-    data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False, pad_to_multiple_of=None)
-    trainer = Trainer(model=model, args=training_args, train_dataset=train_dataset, eval_dataset=eval_dataset, tokenizer=tokenizer, data_collator=data_collator)
+    # pad_to_multiple_of=8: dinamik padding korunur ama sekans uzunluğu 8'in katına yuvarlanır;
+    # bf16 GEMM'ler Tensor Core karolarına hizalanır ve pinned tamponlar tekrar kullanılabilir
+    # torch.compile açıksa sabit şekil kovaları için COMPILE_PAD_MULTIPLE (8'in katı) kullanılır
+    pad_multiple = COMPILE_PAD_MULTIPLE if USE_TORCH_COMPILE else 8
+    data_collator = LengthDroppingCollator(DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False, pad_to_multiple_of=pad_multiple))
+    # Erken durdurma: eval_loss bir epoch boyunca en az 0.001 iyileşmezse eğitim durur,
+    # num_epochs üst sınır olarak kalır (load_best_model_at_end en iyi checkpoint'i geri yükler)
+    callbacks = []
+    if eval_dataset is not None:
+        callbacks.append(EarlyStoppingCallback(early_stopping_patience=1, early_stopping_threshold=0.001))
+    trainer = Trainer(model=model, args=training_args, train_dataset=train_dataset, eval_dataset=eval_dataset, tokenizer=tokenizer, data_collator=data_collator, callbacks=callbacks)
     
     # Eğitim sürecini başlat
     train_start_time = datetime.now()
@@ -269,7 +644,8 @@ def train_model(model, tokenizer, train_dataset, output_dir: Path, num_epochs: i
     # Modeli kaydet
     print(f"[TRAIN] Model kaydediliyor: {output_dir}")
     trainer.save_model(str(output_dir))
-    tokenizer.save_pretrained(str(output_dir))
+    if trainer.is_world_process_zero():
+        tokenizer.save_pretrained(str(output_dir))
     print(f"[TRAIN] Eğitim tamamlandı! Süre: {train_duration}")
     
     # TrainResult objesi immutable olduğu için wrapper kullanarak custom attribute'lar ekle
@@ -281,14 +657,13 @@ def train_model(model, tokenizer, train_dataset, output_dir: Path, num_epochs: i
             self.train_start_time = train_start_time
             self.train_end_time = train_end_time
             self.model_name = model_name
-            # TrainResult'un tüm özelliklerini proxy olarak erişilebilir yap
-            for attr in dir(train_result):
-                if not attr.startswith('_'):
-                    try:
-                        if not hasattr(self, attr):
-                            setattr(self, attr, getattr(train_result, attr))
-                    except:
-                        pass
+        
+        def __getattr__(self, name):
+            # Wrapper'da olmayan özellikler (metrics, global_step vb.) erişildiği anda TrainResult'tan okunur.
+            # train_result henüz atanmamışsa (copy/pickle, yarım kalan __init__) sonsuz özyineleme olmaması için hata verilir
+            if name == "train_result":
+                raise AttributeError(name)
+            return getattr(self.train_result, name)
     
     actual_model_name = model_name if model_name else getattr(model, 'model_name', None)
     wrapped_result = TrainResultWrapper(train_result, train_duration, train_start_time, train_end_time, model_name=actual_model_name)
@@ -300,8 +675,13 @@ def calculate_model_statistics(model):
     Model istatistiklerini hesaplar (toplam, eğitilebilir, dondurulmuş parametreler).
     LoRA fine-tuning'de sadece adapter parametreleri eğitilir, base model dondurulmuştur.
     """
-    total_params = sum(p.numel() for p in model.parameters())
-    trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    # Parametreler tek geçişte sayılır (numel her tensör için bir kez çağrılır)
+    total_params = trainable_params = 0
+    for p in model.parameters():
+        n = p.numel()
+        total_params += n
+        if p.requires_grad:
+            trainable_params += n
     frozen_params = total_params - trainable_params
     
     stats = {
@@ -313,94 +693,123 @@ def calculate_model_statistics(model):
     
     return stats
 
-def test_model(model, tokenizer, test_prompts: list, max_new_tokens: int = 50):
+# Eğitim sonrası test prompt'ları (modül seviyesinde sabit; main'de bir kez tokenize edilir)
+TEST_PROMPTS = ["user: Bugün çok mutluyum! assistant:", "user: İş yerinde sorun yaşıyorum. assistant:", "user: Yeni bir hobi edindim. assistant:", "user: Çok yorgunum. assistant:", "user: Harika bir haber aldım! assistant:"]
+
+def _safe_generation_max_length(tokenizer) -> int:
+    """Prompt tokenization için güvenli max_length (model_max_length tanımsızsa ~1e30 olabilir, 512 ile sınırlanır)."""
+    return int(min(512, getattr(tokenizer, 'model_max_length', 512)))
+
+def encode_test_prompts(tokenizer, test_prompts: list, test_batch_size: int = 8) -> list:
+    """
+    Test prompt'larını test_batch_size'lık gruplar halinde soldan padding ile tokenize eder.
+    Batch generation'da üretim tüm satırlarda aynı konumdan başlar.
+    
+    Returns:
+        list: (batch_start, batch_prompts, encoded) üçlüleri; encoded CPU'da BatchEncoding
+    """
+    safe_max_length = _safe_generation_max_length(tokenizer)
+    batches = []
+    original_padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        for batch_start in range(0, len(test_prompts), test_batch_size):
+            batch_prompts = test_prompts[batch_start:batch_start + test_batch_size]
+            encoded = tokenizer(
+                batch_prompts, 
+                return_tensors="pt", 
+                padding=True, 
+                truncation=True, 
+                max_length=safe_max_length  # Güvenli max_length kullan
+            )
+            batches.append((batch_start, batch_prompts, encoded))
+    finally:
+        tokenizer.padding_side = original_padding_side
+    return batches
+
+def test_model(model, tokenizer, test_prompts: list, max_new_tokens: int = 50, test_batch_size: int = 8, encoded_batches: list = None):
     """
     Eğitilmiş modeli test eder ve üretilen cevapları döndürür.
-    Her prompt için text generation yapar ve sonuçları kaydeder.
+    Prompt'lar test_batch_size'lık gruplar halinde tek generate çağrısıyla üretilir
+    (soldan padding ile) ve sonuçlar prompt sırasıyla kaydedilir.
+    encoded_batches (encode_test_prompts çıktısı) verilirse prompt'lar yeniden tokenize edilmez.
     Kısa, doğal ve tutarlı cevaplar için optimize edilmiş parametreler kullanılır.
     """
     print("[TEST] Model test ediliyor...")
     results = []
     model.eval()  # Evaluation moduna geç
     
-    for i, prompt in enumerate(test_prompts, 1):
-        print(f"[TEST] Test {i}/{len(test_prompts)}: {prompt[:50]}...")
+    if encoded_batches is None:
+        encoded_batches = encode_test_prompts(tokenizer, test_prompts, test_batch_size)
+    
+    # Prompt'tan bağımsız ayarlar döngü dışında bir kez hesaplanır
+    safe_max_length = _safe_generation_max_length(tokenizer)
+    
+    # Pad token ve EOS token ID'lerini güvenli şekilde belirle
+    # None kontrolü yap ve varsayılan değerler kullan
+    if tokenizer.pad_token_id is not None:
+        pad_token_id = int(tokenizer.pad_token_id)
+    elif tokenizer.eos_token_id is not None:
+        pad_token_id = int(tokenizer.eos_token_id)
+    else:
+        pad_token_id = 0  # Son çare olarak 0 kullan
+    
+    if tokenizer.eos_token_id is not None:
+        eos_token_id = int(tokenizer.eos_token_id)
+    elif tokenizer.pad_token_id is not None:
+        eos_token_id = int(tokenizer.pad_token_id)
+    else:
+        eos_token_id = pad_token_id  # Varsayılan olarak pad_token_id kullan
+    
+    # Generation parametreleri - sayısal değerler burada bir kez int'e çevrilir
+    # (numpy.int64 / "int too big to convert" sorunlarını önler)
+    gen_kwargs = dict(
+        max_new_tokens=int(max_new_tokens),
+        do_sample=True,  # Sampling kullan
+        use_cache=True,  # Eğitimde kapatılan KV cache generation için açılır
+        repetition_penalty=1.2,  # Tekrarları hafifçe cezalandır
+        no_repeat_ngram_size=0,
+        top_k=50,  # En olası 50 token arasından seçim
+        top_p=0.95,  # Kümülatif olasılığı %95 olan tokenlerden seçim
+        temperature=0.8,  # Hafifçe yaratıcı ama tutarlı
+        pad_token_id=pad_token_id,
+        eos_token_id=eos_token_id
+    )
+    
+    for batch_start, batch_prompts, encoded in encoded_batches:
+        for i, prompt in enumerate(batch_prompts, batch_start + 1):
+            print(f"[TEST] Test {i}/{len(test_prompts)}: {prompt[:50]}...")
         try:
-            # Prompt'u tokenize et - max_length'ı güvenli bir değerle sınırla
-            # model_max_length çok büyük olabilir (ör. 10240), bu yüzden 512 ile sınırla
-            model_max_len = getattr(tokenizer, 'model_max_length', 512)
-            # Çok büyük değerleri sınırla (bazı modellerde 10240 gibi değerler olabilir)
-            safe_max_length = min(512, model_max_len) if model_max_len < 10000 else 512
-            
-            encoded = tokenizer(
-                prompt, 
-                return_tensors="pt", 
-                padding=True, 
-                truncation=True, 
-                max_length=safe_max_length  # Güvenli max_length kullan
-            )
+            encoded = encoded.to(model.device)  # Batch tek seferde modelin cihazına taşınır (DDP'de kendi GPU'su)
             input_ids = encoded.input_ids
             attention_mask = encoded.attention_mask
             
-            # GPU'ya taşı (varsa)
-            if torch.cuda.is_available():
-                input_ids = input_ids.cuda()
-                attention_mask = attention_mask.cuda()
-            
-            # Pad token ve EOS token ID'lerini güvenli şekilde belirle
-            # None kontrolü yap ve varsayılan değerler kullan
-            if tokenizer.pad_token_id is not None:
-                pad_token_id = int(tokenizer.pad_token_id)
-            elif tokenizer.eos_token_id is not None:
-                pad_token_id = int(tokenizer.eos_token_id)
-            else:
-                pad_token_id = 0  # Son çare olarak 0 kullan
-            
-            if tokenizer.eos_token_id is not None:
-                eos_token_id = int(tokenizer.eos_token_id)
-            elif tokenizer.pad_token_id is not None:
-                eos_token_id = int(tokenizer.pad_token_id)
-            else:
-                eos_token_id = pad_token_id  # Varsayılan olarak pad_token_id kullan
-            
-            # Text generation - iyileştirilmiş parametreler ile
-            # min_length hesaplamasını düzelt (çok büyük olmasını önle)
-            input_length = input_ids.shape[-1]
-            min_length_value = input_length + 3  # Minimum 3 token yanıt garantisi
-            # min_length'ın max_length'ı aşmamasını garantile
-            max_possible_length = safe_max_length if safe_max_length < 10000 else 512
-            min_length_value = min(min_length_value, max_possible_length)
+            # Prompt'a bağlı tek değer: min_length (minimum 3 token yanıt, safe_max_length'ı aşmaz)
+            prompt_length = input_ids.shape[-1]
+            min_length_value = min(prompt_length + 3, safe_max_length)
             
-            with torch.no_grad():
-                # Tüm sayısal parametreleri int() ile sar (int too big to convert hatasını önlemek için)
+            # inference_mode: no_grad'a ek olarak version counter/view takibi de kapatılır
+            with torch.inference_mode():
                 outputs = model.generate(
                     input_ids=input_ids,
                     attention_mask=attention_mask,  # Attention mask'i açıkça ver
-                    max_new_tokens=int(max_new_tokens),  # int'e zorlama (numpy.int64 sorununu önler)
-                    min_length=int(min_length_value),  # int'e zorlama
-                    do_sample=True,  # Sampling kullan
-                    repetition_penalty=float(1.2),  # Tekrarları hafifçe cezalandır
-                    no_repeat_ngram_size=int(0),  # int'e zorlama
-                    top_k=int(50),  # En olası 50 token arasından seçim (int'e zorlama)
-                    top_p=float(0.95),  # Kümülatif olasılığı %95 olan tokenlerden seçim
-                    temperature=float(0.8),  # Hafifçe yaratıcı ama tutarlı
-                    pad_token_id=int(pad_token_id),  # int'e zorlama (güvenlik için)
-                    eos_token_id=int(eos_token_id)  # int'e zorlama (güvenlik için)
+                    min_length=min_length_value,
+                    **gen_kwargs
                 )
             
-            # Sadece modelin ürettiği yanıtı al (prompt'u çıkar)
-            response_ids = outputs[0][input_ids.shape[-1]:]
-            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            generated_response = tokenizer.decode(response_ids, skip_special_tokens=True)
+            # Sadece modelin ürettiği yanıtları al (prompt'ları çıkar), tek seferde decode et
+            generated_texts = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            generated_responses = tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
             
-            # EOS token'dan sonrasını temizle (varsa)
-            if tokenizer.eos_token:
-                generated_response = generated_response.split(tokenizer.eos_token)[0].strip()
-            
-            results.append({"prompt": prompt, "generated_text": generated_text, "response": generated_response})
+            for prompt, generated_text, generated_response in zip(batch_prompts, generated_texts, generated_responses):
+                # EOS token'dan sonrasını temizle (varsa)
+                if tokenizer.eos_token:
+                    generated_response = generated_response.split(tokenizer.eos_token)[0].strip()
+                results.append({"prompt": prompt, "generated_text": generated_text, "response": generated_response})
         except Exception as e:
-            print(f"[TEST] Hata (Test {i}): {e}")
-            results.append({"prompt": prompt, "generated_text": f"[HATA: {str(e)}]", "response": f"[HATA: {str(e)}]"})
+            print(f"[TEST] Hata (Test {batch_start + 1}-{batch_start + len(batch_prompts)}): {e}")
+            for prompt in batch_prompts:
+                results.append({"prompt": prompt, "generated_text": f"[HATA: {str(e)}]", "response": f"[HATA: {str(e)}]"})
     
     return results
 
@@ -411,113 +820,120 @@ def create_training_report(model_stats: dict, train_result, dataset_info: dict,
     """
     print(f"[REPORT] Rapor oluşturuluyor: {output_file}")
     
+    # Rapor parçaları listede toplanır, dosyaya tek seferde yazılır
+    SEP = "=" * 80 + "\n"
+    out = []
+    
     try:
+        # Rapor başlığı ve tarih
+        out.append(SEP + "LoRA EĞİTİM RAPORU\n" + SEP + "\n")
+        out.append(f"Oluşturulma Tarihi: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        
+        # Model bilgileri
+        actual_model_name = getattr(train_result, 'model_name', 'ytu-ce-cosmos/turkish-gpt2-medium') if hasattr(train_result, 'model_name') else 'ytu-ce-cosmos/turkish-gpt2-medium'
+        out.append(SEP + "MODEL BİLGİLERİ\n" + SEP)
+        out.append(f"Base Model: {actual_model_name}\n")
+        if 'bert' in str(actual_model_name).lower():
+            out.append("Model Tipi: BERT Turkish (CausalLM wrapper ile generation için)\n")
+            target_mods = "['query', 'key', 'value', 'dense'] (BERT)"
+        elif 'turkish-gpt2' in str(actual_model_name).lower() or 'turkish' in str(actual_model_name).lower():
+            out.append("Model Tipi: Turkish GPT-2 Medium (Türkçe için optimize edilmiş GPT-2)\n")
+            target_mods = "['c_attn', 'c_proj'] (GPT-2)"
+        elif 'dialogpt' in str(actual_model_name).lower():
+            out.append("Model Tipi: DialoGPT Large (Conversational AI - GPT-2 tabanlı)\n")
+            target_mods = "['c_attn', 'c_proj'] (GPT-2/DialoGPT)"
+        else:
+            out.append("Model Tipi: GPT-2\n")
+            target_mods = "['c_attn', 'c_proj'] (GPT-2)"
+        out.append("Fine-tuning Yöntemi: LoRA (Low-Rank Adaptation)\nLoRA Rank (r): 16\nLoRA Alpha: 32\nLoRA Dropout: 0.05\nLoRA Bias: none\n")
+        out.append(f"Target Modules: {target_mods}\n")
+        out.append(f"Base Model Kuantizasyonu: {'4-bit NF4, double quant (QLoRA)' if USE_4BIT else 'Yok'}\n\n")
+        
+        # Model istatistikleri (LoRA ile sadece adapter parametreleri eğitilir)
+        out.append(SEP + "MODEL İSTATİSTİKLERİ\n" + SEP)
+        out.append(f"Toplam Parametre: {model_stats['total_parameters']:,}\nEğitilebilir Parametre: {model_stats['trainable_parameters']:,}\n")
+        out.append(f"Dondurulmuş Parametre: {model_stats['frozen_parameters']:,}\nEğitilebilir Oran: {model_stats['trainable_percentage']:.2f}%\n\n")
+        
+        # Dataset bilgileri
+        out.append(SEP + "DATASET BİLGİLERİ\n" + SEP)
+        out.append(f"Veri Dosyası: {dataset_info['file_path']}\nToplam Diyalog: {dataset_info['total_samples']:,}\n")
+        out.append(f"Train Set: {dataset_info.get('train_samples', 'N/A'):,} örnek\n")
+        out.append(f"Validation Set: {dataset_info.get('validation_samples', 'N/A'):,} örnek ({dataset_info.get('validation_ratio', 0)*100:.1f}%)\n")
+        out.append(f"Ortalama Uzunluk: {dataset_info['avg_length']:.2f} karakter\nMin: {dataset_info['min_length']}, Max: {dataset_info['max_length']}\n\n")
+        
+        # Eğitim bilgileri (epoch, batch size, GPU kullanımı vb.)
+        out.append(SEP + "EĞİTİM BİLGİLERİ\n" + SEP)
+        if hasattr(train_result, 'train_start_time'):
+            out.append(f"Başlangıç: {train_result.train_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            out.append(f"Bitiş: {train_result.train_end_time.strftime('%Y-%m-%d %H:%M:%S')}\nToplam Süre: {train_result.train_duration}\n\n")
+        out.append(f"Epoch Sayısı: {num_epochs}\nBatch Size: {batch_size}\nGradient Accumulation Steps: {grad_accum}\n")
+        out.append(f"GPU (Süreç) Sayısı: {WORLD_SIZE}\nEffective Batch Size: {batch_size * grad_accum * WORLD_SIZE}\nLearning Rate: 2e-4\nOptimizer: {OPTIMIZER}\n")
+        out.append(f"LR Scheduler: cosine\nWarmup Ratio: 0.1\n")
+        out.append(f"GPU Kullanımı: {'Evet' if torch.cuda.is_available() else 'Hayır (CPU modunda)'}\n")
+        if torch.cuda.is_available():
+            out.append(f"Mixed Precision: {'bf16 (RTX 4060 için optimize edilmiş)' if USE_BF16 else 'fp16 (GPU bf16 desteklemiyor)'}\n")
+        if torch.cuda.is_available():
+            out.append(f"GPU: {torch.cuda.get_device_name(0)}\nCUDA Version: {torch.version.cuda}\n")
+            out.append(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB\n")
+        else:
+            out.append("Uyarı: CPU modunda eğitim GPU'dan çok daha yavaş olacaktır!\n")
+        out.append("\n")
+        
+        # Eğitim metrikleri (train loss, validation loss vb.)
+        out.append(SEP + "EĞİTİM METRİKLERİ\n" + SEP)
+        if hasattr(train_result, 'metrics'):
+            train_metrics = {k: v for k, v in train_result.metrics.items() if not k.startswith('eval_')}
+            if train_metrics:
+                out.append("Train Metrikleri:\n")
+                for key, value in train_metrics.items():
+                    out.append(f"  {key}: {value:.6f}\n" if isinstance(value, float) else f"  {key}: {value}\n")
+                out.append("\n")
+            eval_metrics = {k: v for k, v in train_result.metrics.items() if k.startswith('eval_')}
+            if eval_metrics:
+                out.append("Validation Metrikleri:\n")
+                for key, value in eval_metrics.items():
+                    display_key = key.replace('eval_', '')
+                    out.append(f"  {display_key}: {value:.6f}\n" if isinstance(value, float) else f"  {display_key}: {value}\n")
+                out.append("\n")
+                if 'eval_loss' in eval_metrics:
+                    out.append(f"En İyi Validation Loss: {eval_metrics['eval_loss']:.6f}\n")
+                    out.append("(En düşük validation loss'a sahip model otomatik olarak yüklendi)\n")
+        out.append("\n")
+        
+        if hasattr(train_result, 'log_history'):
+            out.append(SEP + "LOSS GEÇMİŞİ (Örnekler)\n" + SEP)
+            loss_entries = [log for log in train_result.log_history if 'loss' in log]
+            if loss_entries:
+                for i, entry in enumerate(loss_entries[:10], 1):
+                    out.append(f"Step {entry.get('step', 'N/A')}: Loss = {entry.get('loss', 'N/A'):.6f}\n")
+                if len(loss_entries) > 10:
+                    out.append(f"... (toplam {len(loss_entries)} loss kaydı)\n")
+            out.append("\n")
+        
+        out.append(SEP + "TEST SONUÇLARI\n" + SEP + f"Test Örnek Sayısı: {len(test_results)}\n\n")
+        for i, result in enumerate(test_results, 1):
+            out.append(f"\n--- TEST {i} ---\nPrompt: {result['prompt']}\n\nTam Çıktı:\n{result['generated_text']}\n\nSadece Yanıt:\n{result['response']}\n" + "-" * 80 + "\n")
+        
+        model_name_for_note = train_result.model_name if hasattr(train_result, 'model_name') else 'ytu-ce-cosmos/turkish-gpt2-medium'
+        out.append("\n" + SEP + "KAYIT BİLGİLERİ\n" + SEP + f"Model Klasörü: {OUTPUT_MODEL_DIR}\nRapor Dosyası: {output_file}\n\n")
+        out.append(SEP + "NOTLAR\n" + SEP)
+        out.append("- Model LoRA adapter ağırlıklarını içerir\n")
+        out.append(f"- Base model ({model_name_for_note}) ayrıca indirilmelidir\n")
+        out.append("- Inference için base model + LoRA adapter birlikte kullanılmalıdır\n")
+        out.append("- Model dosyaları: adapter_config.json, adapter_model.safetensors\n")
+        if 'turkish-gpt2' in str(model_name_for_note).lower() or 'turkish' in str(model_name_for_note).lower():
+            out.append("- Turkish GPT-2 Medium Türkçe için özel olarak eğitilmiş modeldir, generation için idealdir\n")
+            out.append("- RTX 4060 için bf16 mixed precision kullanılmıştır\n")
+        elif 'bert' in str(model_name_for_note).lower():
+            out.append("- BERT Turkish Türkçe için optimize edilmiş, CausalLM wrapper ile generation için kullanılıyor\n")
+        elif 'dialogpt' in str(model_name_for_note).lower():
+            out.append("- DialoGPT Large conversational AI için tasarlanmış, generation için idealdir\n")
+        else:
+            out.append("- GPT-2 modeli kullanılmıştır\n")
+        out.append("\n" + SEP + "RAPOR SONU\n" + SEP)
+        
         with open(output_file, 'w', encoding='utf-8') as f:
-            # Rapor başlığı ve tarih
-            f.write("=" * 80 + "\nLoRA EĞİTİM RAPORU\n" + "=" * 80 + "\n\n")
-            f.write(f"Oluşturulma Tarihi: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # Model bilgileri
-            actual_model_name = getattr(train_result, 'model_name', 'ytu-ce-cosmos/turkish-gpt2-medium') if hasattr(train_result, 'model_name') else 'ytu-ce-cosmos/turkish-gpt2-medium'
-            f.write("=" * 80 + "\nMODEL BİLGİLERİ\n" + "=" * 80 + "\n")
-            f.write(f"Base Model: {actual_model_name}\n")
-            if 'bert' in str(actual_model_name).lower():
-                f.write("Model Tipi: BERT Turkish (CausalLM wrapper ile generation için)\n")
-                target_mods = "['query', 'key', 'value', 'dense'] (BERT)"
-            elif 'turkish-gpt2' in str(actual_model_name).lower() or 'turkish' in str(actual_model_name).lower():
-                f.write("Model Tipi: Turkish GPT-2 Medium (Türkçe için optimize edilmiş GPT-2)\n")
-                target_mods = "['c_attn', 'c_proj'] (GPT-2)"
-            elif 'dialogpt' in str(actual_model_name).lower():
-                f.write("Model Tipi: DialoGPT Large (Conversational AI - GPT-2 tabanlı)\n")
-                target_mods = "['c_attn', 'c_proj'] (GPT-2/DialoGPT)"
-            else:
-                f.write("Model Tipi: GPT-2\n")
-                target_mods = "['c_attn', 'c_proj'] (GPT-2)"
-            f.write("Fine-tuning Yöntemi: LoRA (Low-Rank Adaptation)\nLoRA Rank (r): 16\nLoRA Alpha: 32\nLoRA Dropout: 0.05\nLoRA Bias: none\n")
-            f.write(f"Target Modules: {target_mods}\n\n")
-            
-            # Model istatistikleri (LoRA ile sadece adapter parametreleri eğitilir)
-            f.write("=" * 80 + "\nMODEL İSTATİSTİKLERİ\n" + "=" * 80 + "\n")
-            f.write(f"Toplam Parametre: {model_stats['total_parameters']:,}\nEğitilebilir Parametre: {model_stats['trainable_parameters']:,}\n")
-            f.write(f"Dondurulmuş Parametre: {model_stats['frozen_parameters']:,}\nEğitilebilir Oran: {model_stats['trainable_percentage']:.2f}%\n\n")
-            
-            # Dataset bilgileri
-            f.write("=" * 80 + "\nDATASET BİLGİLERİ\n" + "=" * 80 + "\n")
-            f.write(f"Veri Dosyası: {dataset_info['file_path']}\nToplam Diyalog: {dataset_info['total_samples']:,}\n")
-            f.write(f"Train Set: {dataset_info.get('train_samples', 'N/A'):,} örnek\n")
-            f.write(f"Validation Set: {dataset_info.get('validation_samples', 'N/A'):,} örnek ({dataset_info.get('validation_ratio', 0)*100:.1f}%)\n")
-            f.write(f"Ortalama Uzunluk: {dataset_info['avg_length']:.2f} karakter\nMin: {dataset_info['min_length']}, Max: {dataset_info['max_length']}\n\n")
-            
-            # Eğitim bilgileri (epoch, batch size, GPU kullanımı vb.)
-            f.write("=" * 80 + "\nEĞİTİM BİLGİLERİ\n" + "=" * 80 + "\n")
-            if hasattr(train_result, 'train_start_time'):
-                f.write(f"Başlangıç: {train_result.train_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Bitiş: {train_result.train_end_time.strftime('%Y-%m-%d %H:%M:%S')}\nToplam Süre: {train_result.train_duration}\n\n")
-            f.write(f"Epoch Sayısı: {num_epochs}\nBatch Size: {batch_size}\nGradient Accumulation Steps: {grad_accum}\n")
-            f.write(f"Effective Batch Size: {batch_size * grad_accum}\nLearning Rate: 2e-4\n")
-            f.write(f"LR Scheduler: cosine\nWarmup Ratio: 0.1\n")
-            f.write(f"GPU Kullanımı: {'Evet' if torch.cuda.is_available() else 'Hayır (CPU modunda)'}\n")
-            if torch.cuda.is_available():
-                f.write(f"Mixed Precision: bf16 (RTX 4060 için optimize edilmiş)\n")
-            if torch.cuda.is_available():
-                f.write(f"GPU: {torch.cuda.get_device_name(0)}\nCUDA Version: {torch.version.cuda}\n")
-                f.write(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.2f} GB\n")
-            else:
-                f.write("Uyarı: CPU modunda eğitim GPU'dan çok daha yavaş olacaktır!\n")
-            f.write("\n")
-            
-            # Eğitim metrikleri (train loss, validation loss vb.)
-            f.write("=" * 80 + "\nEĞİTİM METRİKLERİ\n" + "=" * 80 + "\n")
-            if hasattr(train_result, 'metrics'):
-                train_metrics = {k: v for k, v in train_result.metrics.items() if not k.startswith('eval_')}
-                if train_metrics:
-                    f.write("Train Metrikleri:\n")
-                    for key, value in train_metrics.items():
-                        f.write(f"  {key}: {value:.6f}\n" if isinstance(value, float) else f"  {key}: {value}\n")
-                    f.write("\n")
-                eval_metrics = {k: v for k, v in train_result.metrics.items() if k.startswith('eval_')}
-                if eval_metrics:
-                    f.write("Validation Metrikleri:\n")
-                    for key, value in eval_metrics.items():
-                        display_key = key.replace('eval_', '')
-                        f.write(f"  {display_key}: {value:.6f}\n" if isinstance(value, float) else f"  {display_key}: {value}\n")
-                    f.write("\n")
-                    if 'eval_loss' in eval_metrics:
-                        f.write(f"En İyi Validation Loss: {eval_metrics['eval_loss']:.6f}\n")
-                        f.write("(En düşük validation loss'a sahip model otomatik olarak yüklendi)\n")
-            f.write("\n")
-            
-            if hasattr(train_result, 'log_history'):
-                f.write("=" * 80 + "\nLOSS GEÇMİŞİ (Örnekler)\n" + "=" * 80 + "\n")
-                loss_entries = [log for log in train_result.log_history if 'loss' in log]
-                if loss_entries:
-                    for i, entry in enumerate(loss_entries[:10], 1):
-                        f.write(f"Step {entry.get('step', 'N/A')}: Loss = {entry.get('loss', 'N/A'):.6f}\n")
-                    if len(loss_entries) > 10:
-                        f.write(f"... (toplam {len(loss_entries)} loss kaydı)\n")
-                f.write("\n")
-            
-            f.write("=" * 80 + "\nTEST SONUÇLARI\n" + "=" * 80 + f"\nTest Örnek Sayısı: {len(test_results)}\n\n")
-            for i, result in enumerate(test_results, 1):
-                f.write(f"\n--- TEST {i} ---\nPrompt: {result['prompt']}\n\nTam Çıktı:\n{result['generated_text']}\n\nSadece Yanıt:\n{result['response']}\n" + "-" * 80 + "\n")
-            
-            model_name_for_note = train_result.model_name if hasattr(train_result, 'model_name') else 'ytu-ce-cosmos/turkish-gpt2-medium'
-            f.write("\n" + "=" * 80 + "\nKAYIT BİLGİLERİ\n" + "=" * 80 + f"\nModel Klasörü: {OUTPUT_MODEL_DIR}\nRapor Dosyası: {output_file}\n\n")
-            f.write("=" * 80 + "\nNOTLAR\n" + "=" * 80 + "\n")
-            f.write("- Model LoRA adapter ağırlıklarını içerir\n")
-            f.write(f"- Base model ({model_name_for_note}) ayrıca indirilmelidir\n")
-            f.write("- Inference için base model + LoRA adapter birlikte kullanılmalıdır\n")
-            f.write("- Model dosyaları: adapter_config.json, adapter_model.bin\n")
-            if 'turkish-gpt2' in str(model_name_for_note).lower() or 'turkish' in str(model_name_for_note).lower():
-                f.write("- Turkish GPT-2 Medium Türkçe için özel olarak eğitilmiş modeldir, generation için idealdir\n")
-                f.write("- RTX 4060 için bf16 mixed precision kullanılmıştır\n")
-            elif 'bert' in str(model_name_for_note).lower():
-                f.write("- BERT Turkish Türkçe için optimize edilmiş, CausalLM wrapper ile generation için kullanılıyor\n")
-            elif 'dialogpt' in str(model_name_for_note).lower():
-                f.write("- DialoGPT Large conversational AI için tasarlanmış, generation için idealdir\n")
-            else:
-                f.write("- GPT-2 modeli kullanılmıştır\n")
-            f.write("\n" + "=" * 80 + "\nRAPOR SONU\n" + "=" * 80 + "\n")
+            f.write("".join(out))
         
         print(f"[REPORT] Rapor başarıyla kaydedildi: {output_file}")
         
@@ -548,6 +964,14 @@ def main():
     print()
     
     try:
+        # torchrun ile başlatıldıysa süreç kendi GPU'suna bağlanır ve NCCL süreç grubu kurulur;
+        # Trainer modeli DistributedDataParallel ile sarar (gradyanlar süreçler arası all-reduce edilir)
+        if LOCAL_RANK != -1:
+            torch.cuda.set_device(LOCAL_RANK)
+            if not torch.distributed.is_initialized():
+                torch.distributed.init_process_group("nccl")
+            print(f"[DDP] Rank {RANK}/{WORLD_SIZE}, local rank {LOCAL_RANK}")
+        
         # Tekrarlanabilirlik için global seed'i erken safhada kilitle
         # Trainer, PyTorch ve veri karıştırma süreçleri aynı seed ile çalışacak
         set_global_seed(DEFAULT_SEED)
@@ -555,11 +979,12 @@ def main():
         # Test modu aktifse sadece 500 satır al
         limit = 500 if test_mode else None
         conversations = load_dataset_from_file(TRAIN_DATA_FILE, limit=limit)
-        print(f"[STEP 1] Toplam {len(conversations)} diyalog yüklendi")
+        lengths = conversation_lengths(conversations)
+        print(f"[STEP 1] Toplam {len(lengths)} diyalog yüklendi")
         
         # Dataset istatistikleri hesapla
-        lengths = [len(conv) for conv in conversations]
-        dataset_info = {"file_path": str(TRAIN_DATA_FILE), "total_samples": len(conversations), "avg_length": np.mean(lengths), "min_length": min(lengths), "max_length": max(lengths)}
+        # Uzunluklar int32 dizisinde tutulur, indirgemeler C tarafında yapılır
+        dataset_info = {"file_path": str(TRAIN_DATA_FILE), "total_samples": len(lengths), "avg_length": lengths.mean().item(), "min_length": lengths.min().item(), "max_length": lengths.max().item()}
         print(f"[STEP 1] Ortalama uzunluk: {dataset_info['avg_length']:.2f} karakter")
         
         # Adım 2: Model ve tokenizer kurulumu
@@ -568,11 +993,21 @@ def main():
         used_model_name = getattr(model, 'model_name', 'ytu-ce-cosmos/turkish-gpt2-medium')
         # Model istatistiklerini hesapla
         model_stats = calculate_model_statistics(model)
+        # Test prompt'ları tokenizer hazır olur olmaz bir kez tokenize edilir (STEP 5 sadece generate yapar)
+        test_encodings = encode_test_prompts(tokenizer, TEST_PROMPTS)
         print(f"[STEP 2] Eğitilebilir parametre: {model_stats['trainable_parameters']:,} ({model_stats['trainable_percentage']:.2f}%)")
         
         # Adım 3: Dataset tokenization ve train/validation split
         print("\n[STEP 3] Dataset tokenization ve train/validation split...")
-        train_dataset, eval_dataset = prepare_tokenized_dataset(tokenizer, conversations, max_length=512, test_size=0.1)
+        # Önbellek anahtarı: veri dosyası değişince (boyut/mtime) veya limit farklıysa yeniden tokenize edilir
+        data_stat = TRAIN_DATA_FILE.stat()
+        cache_key = f"{TRAIN_DATA_FILE}|{data_stat.st_size}|{data_stat.st_mtime_ns}|{limit}"
+        # DDP'de önce ana süreç tokenize edip önbelleğe yazar, diğerleri önbellekten okur
+        if WORLD_SIZE > 1 and not IS_MAIN_PROCESS:
+            torch.distributed.barrier()
+        train_dataset, eval_dataset = prepare_tokenized_dataset(tokenizer, conversations, max_length=512, test_size=0.1, cache_key=cache_key)
+        if WORLD_SIZE > 1 and IS_MAIN_PROCESS:
+            torch.distributed.barrier()
         print(f"[STEP 3] Train: {len(train_dataset)}, Validation: {len(eval_dataset)}")
         
         # Dataset bilgilerini güncelle
@@ -585,24 +1020,40 @@ def main():
         dataset_size = len(train_dataset)
         print(f"[STEP 4] Train: {dataset_size:,}, Validation: {len(eval_dataset):,} örnek")
         
-        # GPU/CPU'ya göre batch size ayarla (Turkish GPT-2 Medium için optimize edilmiş)
+        precision = select_precision()  # Mixed precision (AMP) modu
+        
+        # GPU'da batch size boş VRAM'e göre otomatik seçilir (effective batch 32 sabit kalır)
+        # DDP'de tüm süreçler en küçük ortak batch'i kullanır, effective batch WORLD_SIZE'a bölünür
         if torch.cuda.is_available():
-            batch_size, grad_accum = 1, 32  # 8GB VRAM'de large model için BATCH=1 ZORUNLUDUR (effective: 32)
-            print(f"[STEP 4] GPU modunda - Batch: {batch_size}, Grad accum: {grad_accum}, Effective: {batch_size * grad_accum}")
+            batch_size, grad_accum = pick_batch_size(model, tokenizer, max_length=512, target_effective=TARGET_EFFECTIVE_BATCH, precision=precision)
+            if WORLD_SIZE > 1:
+                batch_tensor = torch.tensor([batch_size], device="cuda")
+                torch.distributed.all_reduce(batch_tensor, op=torch.distributed.ReduceOp.MIN)
+                batch_size = int(batch_tensor.item())
+                grad_accum = max(1, TARGET_EFFECTIVE_BATCH // (batch_size * WORLD_SIZE))
+            print(f"[STEP 4] GPU modunda - Batch: {batch_size}, Grad accum: {grad_accum}, GPU: {WORLD_SIZE}, Effective: {batch_size * grad_accum * WORLD_SIZE}")
         else:
             batch_size, grad_accum = 2, 8  # CPU'da batch size 2 (effective: 16)
             print(f"[STEP 4] CPU modunda - Batch: {batch_size}, Effective: {batch_size * grad_accum}")
         
-        num_epochs = 5  # Sabit 5 epoch kullanılıyor
+        num_epochs = 5  # Üst sınır; eval_loss platoya ulaşırsa erken durdurma daha önce bitirir
         print(f"[STEP 4] Dataset ({dataset_size}) - {num_epochs} epoch")
         
         # Eğitimi başlat
-        trainer, train_result = train_model(model=model, tokenizer=tokenizer, train_dataset=train_dataset, output_dir=OUTPUT_MODEL_DIR, num_epochs=num_epochs, batch_size=batch_size, gradient_accumulation_steps=grad_accum, model_name=used_model_name, eval_dataset=eval_dataset, eval_strategy="epoch")
+        trainer, train_result = train_model(model=model, tokenizer=tokenizer, train_dataset=train_dataset, output_dir=OUTPUT_MODEL_DIR, num_epochs=num_epochs, batch_size=batch_size, gradient_accumulation_steps=grad_accum, model_name=used_model_name, eval_dataset=eval_dataset, eval_strategy="epoch", precision=precision)
+        
+        # Test ve rapor sadece ana süreçte yapılır
+        if not IS_MAIN_PROCESS:
+            return
         
         # Adım 5: Model test et
         print("\n[STEP 5] Model test ediliyor...")
-        test_prompts = ["user: Bugün çok mutluyum! assistant:", "user: İş yerinde sorun yaşıyorum. assistant:", "user: Yeni bir hobi edindim. assistant:", "user: Çok yorgunum. assistant:", "user: Harika bir haber aldım! assistant:"]
-        test_results = test_model(model, tokenizer, test_prompts, max_new_tokens=50)
+        # Eğitimde kapatılan KV cache generation için tekrar açılır; GPU'da generation autocast altında
+        # (bf16/fp16) yapılır, LoRA adapter matmul'ları da yarı hassasiyetle çalışır
+        model.config.use_cache = True
+        model.eval()
+        with torch.autocast("cuda", dtype=torch.bfloat16 if precision == "bf16" else torch.float16, enabled=precision in ("bf16", "fp16")):
+            test_results = test_model(model, tokenizer, TEST_PROMPTS, max_new_tokens=50, encoded_batches=test_encodings)
         
         # Adım 6: Eğitim raporu oluştur
         print("\n[STEP 6] Eğitim raporu oluşturuluyor...")
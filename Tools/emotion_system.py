@@ -8,28 +8,62 @@ Bu modül LoRA model ile metin üretimi ve LLM ile duygu analizi yapar.
 - mood_emojis.json'dan duyguya göre emoji seçer
 """
 
+import hashlib
 import json
+import logging
+import concurrent.futures
+import functools
 import os
+import queue
 import random
 import re
 import html
+import array
+import threading
+import time
+from collections import OrderedDict
 from typing import Any, Dict, Optional
 from datetime import datetime
 from pathlib import Path
 from openai import OpenAI
 
-from Auth.database import get_db
+from Auth.database import SessionLocal
 from Auth.models import EmotionLog
 
 # LoRA model için gerekli importlar
 try:
-    from transformers import GPT2LMHeadModel, AutoTokenizer
+    from transformers import GPT2LMHeadModel, AutoTokenizer, BitsAndBytesConfig
     from peft import PeftModel
     TRANSFORMERS_AVAILABLE = True
 except ImportError:
     TRANSFORMERS_AVAILABLE = False
     print("[WARNING] transformers veya peft kütüphaneleri bulunamadı. LoRA model kullanılamayacak.")
 
+# Opsiyonel: orjson (C/Rust tabanlı) varsa JSON bytes'tan doğrudan parse edilir, yoksa standart json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# Opsiyonel: bitsandbytes varsa GPU'da base model INT8 yüklenir (ağırlık belleği yarıya iner)
+try:
+    import bitsandbytes  # noqa: F401
+    BITSANDBYTES_AVAILABLE = True
+except ImportError:
+    BITSANDBYTES_AVAILABLE = False
+
+# İstek başına çalışan duygu akışı loglaması: DEBUG seviyesinde mesajlar biçimlendirilmeden atlanır
+# (seviye ANIMALLM_LOG_LEVEL ortam değişkeninden okunur, varsayılan WARNING)
+log = logging.getLogger(__name__)
+if not log.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_log_handler)
+    log.setLevel(getattr(logging, os.getenv("ANIMALLM_LOG_LEVEL", "WARNING").upper(), logging.WARNING))
+    log.propagate = False
+
 # Güvenlik sabitleri
 MAX_EMOTION_MESSAGE_LENGTH = 1000
 DANGEROUS_EMOTION_PATTERNS = [
@@ -42,6 +76,173 @@ DANGEROUS_EMOTION_PATTERNS = [
     r'<object[^>]*>',
     r'<embed[^>]*>',
 ]
+# Tüm pattern'ler tek alternation regex'inde birleştirilir: mesaj 8 ayrı tarama yerine tek geçişte kontrol edilir.
+# Her pattern isimli gruptadır (p0, p1, ...), eşleşen kural lastgroup ile loglanır
+_DANGEROUS_EMOTION_RE = re.compile(
+    "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(DANGEROUS_EMOTION_PATTERNS)),
+    re.IGNORECASE | re.DOTALL
+)
+
+# Unicode emoji karakter sınıfı (_limit_emoji_count için, modül seviyesinde derlenir)
+_EMOJI_CLASS = (
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags
+    "\U00002702-\U000027B0"
+    "\U000024C2-\U0001F251"
+    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    "\U0001FA00-\U0001FAFF"  # Chess Symbols
+    "\U00002600-\U000026FF"  # Miscellaneous Symbols
+    "\U00002700-\U000027BF"  # Dingbats
+    "]"
+)
+_EMOJI_PATTERN = re.compile(_EMOJI_CLASS + "+", flags=re.UNICODE)
+_ZWJ = "\u200d"
+# Tek emoji bloğu: ardışık emoji karakterleri, aralarında ZWJ ile birleşik diziler dahil
+_EMOJI_SEQ_RE = re.compile(f"{_EMOJI_CLASS}(?:{_ZWJ}?{_EMOJI_CLASS})*")
+_WS_RE = re.compile(r'\s+')
+# LoRA çıktısındaki rol önekleri (_clean_lora_response için)
+_ASSISTANT_ROLE_RE = re.compile(r'assistant\s*:\s*', re.IGNORECASE)
+_USER_ROLE_RE = re.compile(r'user\s*:\s*', re.IGNORECASE)
+
+# GPU'da LoRA modelinin forward'ı torch.compile (reduce-overhead / CUDA graph) ile derlenir;
+# EMOTION_TORCH_COMPILE=0 ile kapatılabilir
+LORA_TORCH_COMPILE = os.getenv("EMOTION_TORCH_COMPILE", "1") != "0"
+# GPU'da bitsandbytes kuruluysa base model INT8 yüklenir; EMOTION_LOAD_IN_8BIT=0 ile fp16 + merge kullanılır
+LORA_LOAD_IN_8BIT = os.getenv("EMOTION_LOAD_IN_8BIT", "1") != "0"
+# Eşzamanlı LoRA istekleri LORA_BATCH_WINDOW (sn) içinde toplanıp en fazla LORA_MAX_BATCH_SIZE'lık batch'lerle üretilir
+LORA_BATCH_WINDOW = 0.02
+LORA_MAX_BATCH_SIZE = 8
+LORA_GENERATE_TIMEOUT = 60  # Tek isteğin cevap için en fazla bekleyeceği süre (sn)
+LORA_MAX_NEW_TOKENS = 40  # chat cevabı için üretilecek token sayısı (ısınma da aynı değerle yapılır: static cache boyutu buna bağlı)
+# Derlenmiş modelde prompt'lar bu uzunluk kovalarına soldan pad'lenir (sabit şekil -> yeniden derleme olmaz)
+LORA_PROMPT_BUCKETS = (64, 128, 256, 512)
+# Derlenmiş modelde batch boyutu da bu kovalara (tekrarlanan prompt satırlarıyla) doldurulur;
+# toplam şekil sayısı len(LORA_BATCH_BUCKETS) x len(LORA_PROMPT_BUCKETS) ile sınırlı kalır
+LORA_BATCH_BUCKETS = (1, LORA_MAX_BATCH_SIZE)
+
+# Seçilebilecek ruh halleri (LLM cevabı bu listeyle sınırlandırılır)
+EMOTION_MOODS = (
+    "Mutlu", "Üzgün", "Öfkeli", "Şaşkın", "Utanmış",
+    "Endişeli", "Gülümseyen", "Flörtöz", "Sorgulayıcı", "Yorgun"
+)
+
+# Duygu analizi LLM çağrısının sistem mesajı - görev, öncelik kuralı ve duygu listesi burada sabittir,
+# istek başına sadece kısa kullanıcı/asistan şablonu doldurulur
+EMOTION_SYSTEM_PROMPT = (
+    "Sen bir duygu analiz asistanısın. Verilen kullanıcı mesajını (varsa asistan cevabıyla birlikte) analiz edip "
+    "sadece 1 duygu belirlersin. Kullanıcı mesajındaki duygu ifadeleri daima birinci önceliktir; kullanıcı kendini "
+    "'üzgün' olarak tanımlıyorsa asistan cevabı ne olursa olsun 'Üzgün' seçersin. Asistan cevabı sadece bağlamı pekiştirir. "
+    f"Seçilebilecek ruh halleri (sadece bu listeden): {', '.join(EMOTION_MOODS)}. "
+    'Sadece {"ruh_hali": "Mutlu"} formatında tek bir JSON nesnesi döndürürsün. Başka hiçbir şey yazmazsın.'
+)
+_EMOTION_PROMPT_TMPL = 'Kullanıcı mesajı: "{u}"\nAsistan cevabı: "{a}"'
+_EMOTION_PROMPT_USER_TMPL = 'Kullanıcı mesajı: "{u}"'
+# Gemini JSON modu şeması: ruh_hali alanı sadece EMOTION_MOODS değerlerinden biri olabilir
+EMOTION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"ruh_hali": {"type": "STRING", "enum": list(EMOTION_MOODS)}},
+    "required": ["ruh_hali"],
+}
+
+# Duygu analizi LLM cevapları için LRU önbellek boyutu (aynı mesaj + LoRA cevabı tekrar sorulmaz)
+MOOD_CACHE_SIZE = 4096
+# Eşzamanlı çalışabilecek duygu analizi LLM çağrısı sayısı
+MOOD_POOL_WORKERS = 4
+
+# Kullanıcının duygusunu açıkça söylediği ifadeler -> duygu. Bu ifadelerden biri geçiyorsa duygu
+# LLM'e sorulmadan yerel olarak belirlenir (prompt'taki "kullanıcı mesajı önceliklidir" kuralı)
+_MOOD_KEYWORDS: Dict[str, str] = {
+    **dict.fromkeys(("mutluyum", "sevinçliyim", "seviniyorum", "sevindim", "keyifliyim", "neşeliyim",
+                     "harika hissediyorum"), "Mutlu"),
+    **dict.fromkeys(("üzgünüm", "üzülüyorum", "üzüldüm", "mutsuzum", "kederliyim", "hüzünlüyüm",
+                     "moralim bozuk", "canım sıkkın", "ağlıyorum"), "Üzgün"),
+    **dict.fromkeys(("sinirliyim", "sinirlendim", "sinir oldum", "kızgınım", "öfkeliyim", "çok kızdım"), "Öfkeli"),
+    **dict.fromkeys(("şaşırdım", "şaşkınım", "inanamıyorum", "şok oldum"), "Şaşkın"),
+    **dict.fromkeys(("utandım", "utanıyorum", "mahcubum", "rezil oldum"), "Utanmış"),
+    **dict.fromkeys(("endişeliyim", "endişeleniyorum", "kaygılıyım", "korkuyorum", "tedirginim",
+                     "stresliyim", "gerginim"), "Endişeli"),
+    **dict.fromkeys(("gülümsüyorum", "gülüyorum", "hahaha"), "Gülümseyen"),
+    **dict.fromkeys(("hoşlanıyorum", "aşığım"), "Flörtöz"),
+    **dict.fromkeys(("merak ediyorum", "anlamadım"), "Sorgulayıcı"),
+    **dict.fromkeys(("yorgunum", "yoruldum", "bitkinim", "uykum var", "uykusuzum", "tükendim"), "Yorgun"),
+}
+# Tüm ifadeler tek regex'te (uzun ifadeler önce); hemen ardından "değil" gelen eşleşmeler sayılmaz
+_MOOD_KEYWORD_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(k) for k in sorted(_MOOD_KEYWORDS, key=len, reverse=True)) + r')\b(?!\s+değil)'
+)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_lora_tokenizer(path_or_name: str):
+    """
+    LoRA tokenizer'ını (Rust tabanlı fast tokenizer) yükler; aynı süreçte tekrar istenirse önbellekten döner.
+    Önce sadece yerel dosyalar/HF cache denenir (hub kontrolü yok), bulunamazsa hub'dan indirilir.
+    """
+    try:
+        return AutoTokenizer.from_pretrained(path_or_name, use_fast=True, local_files_only=True)
+    except Exception:
+        return AutoTokenizer.from_pretrained(path_or_name, use_fast=True)
+
+
+def _turkish_lower(text: str) -> str:
+    """Türkçe I/İ harflerini doğru küçültür (str.lower 'İ'yi 'i̇' yapar)"""
+    return text.replace('I', 'ı').replace('İ', 'i').lower()
+
+
+def match_mood_keyword(text: str) -> Optional[str]:
+    """Mesajda açık bir duygu ifadesi varsa karşılık gelen duyguyu döndürür (yoksa None)"""
+    match = _MOOD_KEYWORD_RE.search(_turkish_lower(text))
+    return _MOOD_KEYWORDS[match.group(1)] if match else None
+
+# Duygu kayıtları istek akışında değil, arka plan thread'inde toplu olarak yazılır
+EMOTION_LOG_BATCH_SIZE = 50  # Tek commit'te yazılacak en fazla kayıt
+EMOTION_LOG_FLUSH_INTERVAL = 0.2  # İlk kayıttan sonra batch'i doldurmak için beklenen en uzun süre (sn)
+_emotion_log_queue: "queue.Queue[EmotionLog]" = queue.Queue(maxsize=1024)
+_emotion_log_thread: Optional[threading.Thread] = None
+_emotion_log_thread_lock = threading.Lock()
+
+
+def _emotion_log_worker() -> None:
+    """Kuyruktaki duygu kayıtlarını toplar ve batch başına tek commit ile SQLite'a yazar"""
+    # Session sadece bu thread'e aittir ve tüm batch'ler boyunca tekrar kullanılır
+    db = SessionLocal()
+    try:
+        while True:
+            batch = [_emotion_log_queue.get()]
+            deadline = time.monotonic() + EMOTION_LOG_FLUSH_INTERVAL
+            while len(batch) < EMOTION_LOG_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(_emotion_log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                db.add_all(batch)
+                db.commit()
+                log.debug("[EMOTION] %d duygu kaydı SQLite'a yazıldı", len(batch))
+            except Exception as e:
+                db.rollback()
+                log.error("[EMOTION] Duygu kaydı ekleme hatası (DB): %s", e)
+            finally:
+                db.expunge_all()  # Yazılan nesneler session'da birikmez
+    finally:
+        db.close()
+
+
+def _ensure_emotion_log_worker() -> None:
+    """Duygu kaydı yazıcı thread'ini ilk kullanımda başlatır"""
+    global _emotion_log_thread
+    if _emotion_log_thread is not None and _emotion_log_thread.is_alive():
+        return
+    with _emotion_log_thread_lock:
+        if _emotion_log_thread is None or not _emotion_log_thread.is_alive():
+            _emotion_log_thread = threading.Thread(target=_emotion_log_worker, name="emotion-log-writer", daemon=True)
+            _emotion_log_thread.start()
 
 # Duygu → emoji veri kaynağını yükle (uygulama başında bir kez)
 MOOD_EMOJIS: Dict[str, list[str]] = {}
@@ -52,11 +253,149 @@ try:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     data_path = DATA_DIR / "mood_emojis.json"
     if data_path.exists():
-        import json
-        MOOD_EMOJIS = json.loads(data_path.read_text(encoding="utf-8"))
+        # Dosya bytes olarak okunur (ayrı UTF-8 decode adımı yok)
+        MOOD_EMOJIS = _json_loads(data_path.read_bytes())
 except Exception:
     MOOD_EMOJIS = {}
 
+# Küçük harfli anahtar -> JSON anahtarı (normalize_mood'da O(1) arama için, yükleme sonrası bir kez kurulur)
+_MOOD_KEYS_LOWER: Dict[str, str] = {k.lower(): k for k in MOOD_EMOJIS}
+# Yazım hatası / aksansız yazım -> JSON anahtarı; sadece mood_emojis.json'da bulunan hedefler tutulur
+_MOOD_TYPO_MAP: Dict[str, str] = {
+    typo: mood for typo, mood in {
+        "güllümseyen": "Gülümseyen",
+        "gülümseyen": "Gülümseyen",
+        "gullumseyen": "Gülümseyen",
+        "gulumsyen": "Gülümseyen",
+        "utangaç": "Utanmış",
+        "utanmış": "Utanmış",
+        "utanmis": "Utanmış",
+        "utangac": "Utanmış",
+        "mutlu": "Mutlu",
+        "üzgün": "Üzgün",
+        "uzgun": "Üzgün",
+        "öfkeli": "Öfkeli",
+        "ofkeli": "Öfkeli",
+        "şaşkın": "Şaşkın",
+        "saskin": "Şaşkın",
+        "endişeli": "Endişeli",
+        "endiseli": "Endişeli",
+        "flörtöz": "Flörtöz",
+        "flortoz": "Flörtöz",
+        "flörtoz": "Flörtöz",
+        "flortöz": "Flörtöz",
+        "sorgulayıcı": "Sorgulayıcı",
+        "sorgulayici": "Sorgulayıcı",
+        "yorgun": "Yorgun",
+    }.items()
+    if mood in MOOD_EMOJIS
+}
+
+# Duygu -> emoji tuple'ı (pick_emoji her istekte listeyi yeniden almaz) ve emoji seçimine ayrılmış rastgele üreteç
+_MOOD_OPTIONS: Dict[str, tuple[str, ...]] = {k: tuple(v) for k, v in MOOD_EMOJIS.items()}
+_rng = random.Random()
+
+# Fuzzy eşleşme için (küçük harfli anahtar, JSON anahtarı) listesi ve ilk 3 harfe göre aday indeksi;
+# emoji listesi boş olan anahtarlar hiç eklenmez
+_MOOD_KEYS_LOWER_LIST: list[tuple[str, str]] = [(k.lower(), k) for k, v in MOOD_EMOJIS.items() if v]
+_MOOD_PREFIX_INDEX: Dict[str, list[tuple[str, str]]] = {}
+for _lower_key, _json_key in _MOOD_KEYS_LOWER_LIST:
+    _MOOD_PREFIX_INDEX.setdefault(_lower_key[:3], []).append((_lower_key, _json_key))
+
+
+@functools.lru_cache(maxsize=256)
+def normalize_mood(name: str) -> str:
+    """Duygu ismini mood_emojis.json'daki anahtarlara normalize eder (LLM az sayıda farklı değer ürettiği için önbelleklenir)"""
+    n = name.strip()
+    n_lower = n.lower()
+    # Tek sözlük araması: önce JSON anahtarları, sonra yazım hatası eşlemesi
+    return _MOOD_KEYS_LOWER.get(n_lower) or _MOOD_TYPO_MAP.get(n_lower) or n
+
+
+@functools.lru_cache(maxsize=256)
+def _fuzzy_key(key_lower: str) -> Optional[str]:
+    """Alt dizi eşleşmesiyle ilk uygun (emoji listesi boş olmayan) JSON anahtarını döndürür"""
+    # Önce aynı 3 harfle başlayan anahtarlar (kısa aday listesi), sonra tüm anahtarlar taranır
+    for candidates in (_MOOD_PREFIX_INDEX.get(key_lower[:3], ()), _MOOD_KEYS_LOWER_LIST):
+        for json_lower, json_key in candidates:
+            if json_lower in key_lower or key_lower in json_lower:
+                return json_key
+    return None
+
+
+# extract_json_object için anlamlı işaretler: kaçış dizisi, tırnak ve süslü parantezler
+_JSON_TOKENS = re.compile(r'\\.|"|\{|\}', re.DOTALL)
+# Ters bölü içermeyen metinler için kaçış dizisi alternatifi olmayan sade desen
+_SIMPLE_JSON_TOKENS = re.compile(r'["{}]')
+
+
+def parse_emotion_json(text: str) -> Dict[str, Any] | None:
+    """JSON modundaki LLM cevabını doğrudan parse eder; olmazsa metindeki ilk JSON nesnesini arar"""
+    try:
+        data = _json_loads(text)
+        if isinstance(data, dict):
+            return data
+    except Exception:
+        pass
+    return extract_json_object(text)
+
+
+def extract_json_object(text: str) -> Dict[str, Any] | None:
+    """LLM cevabındaki ilk dengeli {...} JSON nesnesini bulup parse eder (bulunamazsa None)"""
+    t = text.replace("```json", "").replace("```", "").strip()
+    start = t.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    end_index = -1
+    if '\\' not in t:
+        # Hızlı yol (tipik LLM cevabı): ters bölü yoksa kaçış kontrolü gerekmez, sadece tırnak/parantez işaretleri yürünür
+        for m in _SIMPLE_JSON_TOKENS.finditer(t, start):
+            tok = m.group()
+            if tok == '"':
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif tok == '{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    end_index = m.start()
+                    break
+        if end_index == -1:
+            return None
+        try:
+            return _json_loads(t[start:end_index + 1])
+        except Exception:
+            return None
+    # Sadece kaçış dizileri, tırnaklar ve süslü parantezler C seviyesinde bulunur; aradaki karakterler atlanır
+    for m in _JSON_TOKENS.finditer(t, start):
+        tok = m.group()
+        if len(tok) == 2:
+            if in_string:
+                continue  # string içindeki kaçış dizisi (\" dahil) tek seferde atlanır
+            tok = tok[1]  # string dışında ters bölü özel değildir, ardındaki karakter normal işlenir
+        if tok == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif tok == '{':
+            depth += 1
+        elif tok == '}':
+            depth -= 1
+            if depth == 0:
+                end_index = m.end() - 1
+                break
+    if end_index == -1:
+        return None
+    candidate = t[start:end_index + 1]
+    try:
+        return _json_loads(candidate)  # orjson varsa native parse (str doğrudan kabul edilir, encode gerekmez)
+    except Exception:
+        return None
+
 
 class EmotionChatbot:
     def __init__(self, client: OpenAI = None) -> None:
@@ -80,18 +419,40 @@ class EmotionChatbot:
         self.stats: Dict[str, Any] = {
             "requests": 0,
             "last_request_at": None,
+            "mood_cache_hits": 0,
         }
-        self.allowed_moods = [
-            "Mutlu", "Üzgün", "Öfkeli", "Şaşkın", "Utanmış",
-            "Endişeli", "Gülümseyen", "Flörtöz", "Sorgulayıcı", "Yorgun"
-        ]
-        self.emotion_counts: Dict[str, int] = {m: 0 for m in self.allowed_moods}
+        # (kullanıcı mesajı, LoRA cevabı) hash'i -> LLM duygu cevabı; en eski kayıt önce atılır
+        self._mood_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._mood_cache_lock = threading.Lock()
+        # Duygu analizi LLM çağrıları LoRA üretimiyle eşzamanlı bu havuzda çalışır
+        self._mood_pool = concurrent.futures.ThreadPoolExecutor(max_workers=MOOD_POOL_WORKERS, thread_name_prefix="emotion-mood")
+        self._gemini_model = None  # JSON modunda yapılandırılmış Gemini modeli (ilk çağrıda oluşturulur)
+        self.allowed_moods = frozenset(EMOTION_MOODS)
+        # Duygu -> sayaç indeksi; sayımlar duygu sırasıyla sabit boyutlu bir dizide tutulur
+        self._mood_ids: Dict[str, int] = {m: i for i, m in enumerate(EMOTION_MOODS)}
+        self.emotion_counts = array.array('Q', [0] * len(self._mood_ids))
         
         # LoRA model ve tokenizer için lazy loading
         self.lora_model = None
         self.lora_tokenizer = None
         self._lora_loaded = False
         self._lora_loading = False  # Asenkron yükleme durumu
+        # Yükleme bittiğinde (başarılı veya başarısız) set edilir; chat polling yerine bunu bekler
+        self._lora_ready = threading.Event()
+        self._lora_compiled = False  # forward torch.compile ile derlendiyse True (kova padding)
+        self._lora_static_cache = False  # generate'te cache_implementation="static" kullanılır
+        self._lora_eager_forward = None  # derleme öncesi forward (static cache kullanılamazsa geri yüklenir)
+        # LoRA üretim istekleri: (prompt, max_new_tokens, future) -> dispatcher thread'i batch halinde üretir
+        self._gen_queue: "queue.Queue[tuple[str, int, concurrent.futures.Future]]" = queue.Queue()
+        self._gen_thread: Optional[threading.Thread] = None
+        self._gen_thread_lock = threading.Lock()
+        # GPU'da batch girdileri için tekrar kullanılan pinned (page-locked) host tamponları
+        self._host_ids = None
+        self._host_mask = None
+        # Tokenizer yüklendikten sonra bir kez hesaplanan generation sabitleri
+        self._pad_id = 0
+        self._eos_id = 0
+        self._safe_max_len = 512
         
         # Statik cevaplar - belirli mesajlar için önceden tanımlı cevaplar (gizli)
         # Format: (anahtar_kelime_listesi, cevap)
@@ -116,11 +477,12 @@ class EmotionChatbot:
         if not text:
             return ""
         text = html.escape(text, quote=True)
-        for pattern in DANGEROUS_EMOTION_PATTERNS:
-            if re.search(pattern, text, re.IGNORECASE):
-                print(f"[SECURITY] Duygu sisteminde tehlikeli pattern: {pattern}")
-                return "[Güvenlik nedeniyle mesaj filtrelendi]"
-        text = re.sub(r'\s+', ' ', text).strip()
+        match = _DANGEROUS_EMOTION_RE.search(text)
+        if match:
+            pattern = DANGEROUS_EMOTION_PATTERNS[int(match.lastgroup[1:])]
+            print(f"[SECURITY] Duygu sisteminde tehlikeli pattern: {pattern}")
+            return "[Güvenlik nedeniyle mesaj filtrelendi]"
+        text = _WS_RE.sub(' ', text).strip()
         return text
 
     def _validate_emotion_message_length(self, text: str) -> bool:
@@ -142,30 +504,95 @@ class EmotionChatbot:
                     prompt_parts.append(f"Asistan: {content}")
         return "\n".join(prompt_parts)
 
-    def _log_mood_to_db(self, user_id: int, mood: str) -> None:
-        """Duygu kaydını SQLite veritabanına ekler"""
-        if not user_id or not mood:
-            return
-        
+    def _classify_mood(self, emotion_prompt: str) -> str:
+        """Duygu analizi için LLM'i (Gemini/GPT) çağırır ve ham cevap metnini döndürür"""
+        if self.use_gemini:
+            import google.generativeai as genai
+            if self._gemini_model is None:
+                # JSON modu + enum şeması: model sadece {"ruh_hali": "<duygu>"} üretir
+                self._gemini_model = genai.GenerativeModel(
+                    'gemini-2.5-flash',
+                    generation_config=genai.GenerationConfig(
+                        response_mime_type="application/json",
+                        response_schema=EMOTION_RESPONSE_SCHEMA
+                    )
+                )
+            # Sabit iki mesajlık (sistem + kullanıcı) yapı doğrudan tek metne yazılır
+            # (_convert_messages_to_prompt ile aynı çıktı, döngü ve liste olmadan)
+            prompt_text = f"Sistem: {EMOTION_SYSTEM_PROMPT}\nKullanıcı: {emotion_prompt}"
+            response = self._gemini_model.generate_content(prompt_text)
+            emotion_content = response.text
+            log.debug("[EMOTION] Gemini duygu cevabı: %s", emotion_content)
+            return emotion_content
+        completion = self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": EMOTION_SYSTEM_PROMPT},
+                {"role": "user", "content": emotion_prompt}
+            ],
+            temperature=0.2,
+            response_format={"type": "json_object"},  # JSON modu: cevap her zaman geçerli bir JSON nesnesi
+        )
+        return completion.choices[0].message.content or ""
+
+    def _build_emotion_prompt(self, user_message: str, lora_response: Optional[str] = None) -> str:
+        """Duygu analizi için LLM prompt'unu oluşturur; lora_response yoksa sadece kullanıcı mesajı analiz edilir"""
+        if lora_response is None:
+            return _EMOTION_PROMPT_USER_TMPL.format(u=user_message)
+        return _EMOTION_PROMPT_TMPL.format(u=user_message, a=lora_response)
+
+    def _classify_mood_cached(self, user_message: str, lora_response: Optional[str] = None) -> Optional[str]:
+        """
+        LLM duygu cevabını önbellekten veya LLM'den döndürür; hata durumunda None.
+        Önbellek anahtarı (kullanıcı mesajı, LoRA cevabı) hash'idir; sadece kullanıcı mesajıyla
+        yapılan analizler ayrı anahtar kullanır.
+        """
+        key_text = f"{user_message}\x1f{lora_response}" if lora_response is not None else f"{user_message}\x1e"
+        mood_key = hashlib.blake2b(key_text.encode("utf-8"), digest_size=16).hexdigest()
+        emotion_content = self._get_cached_mood(mood_key)
+        if emotion_content is not None:
+            self.stats["mood_cache_hits"] += 1
+            log.debug("[EMOTION] Duygu cevabı önbellekten alındı: %s", emotion_content)
+            return emotion_content
         try:
-            db = next(get_db())
+            emotion_content = self._classify_mood(self._build_emotion_prompt(user_message, lora_response))
         except Exception as e:
-            print(f"[EMOTION] DB bağlantısı oluşturulamadı: {e}")
+            # Hata durumunda önbelleğe yazılmaz, çağıran taraf rastgele duyguya döner
+            log.error("[ERROR] LLM duygu analizi hatası: %s", e)
+            return None
+        self._cache_mood(mood_key, emotion_content)
+        return emotion_content
+
+    def _get_cached_mood(self, key: str) -> Optional[str]:
+        """Önbellekteki LLM duygu cevabını döndürür (yoksa None), bulunan kaydı en yeni yapar"""
+        with self._mood_cache_lock:
+            content = self._mood_cache.get(key)
+            if content is not None:
+                self._mood_cache.move_to_end(key)
+            return content
+
+    def _cache_mood(self, key: str, content: str) -> None:
+        """LLM duygu cevabını önbelleğe ekler, MOOD_CACHE_SIZE aşılırsa en eski kaydı atar"""
+        with self._mood_cache_lock:
+            self._mood_cache[key] = content
+            self._mood_cache.move_to_end(key)
+            if len(self._mood_cache) > MOOD_CACHE_SIZE:
+                self._mood_cache.popitem(last=False)
+
+    def _log_mood_to_db(self, user_id: int, mood: str) -> None:
+        """Duygu kaydını SQLite'a yazılmak üzere kuyruğa ekler (yazma arka plan thread'inde yapılır)"""
+        if not user_id or not mood:
             return
         
+        _ensure_emotion_log_worker()
         try:
-            log = EmotionLog(
+            _emotion_log_queue.put_nowait(EmotionLog(
                 user_id=int(user_id),
                 mood=str(mood).strip()
-            )
-            db.add(log)
-            db.commit()
-            print(f"[EMOTION] Duygu kaydı SQLite'a yazıldı: user_id={user_id}, mood={mood}")
-        except Exception as e:
-            db.rollback()
-            print(f"[EMOTION] Duygu kaydı ekleme hatası (DB): {e}")
-        finally:
-            db.close()
+            ))
+            log.debug("[EMOTION] Duygu kaydı kuyruğa eklendi: user_id=%s, mood=%s", user_id, mood)
+        except queue.Full:
+            log.warning("[EMOTION] Duygu kaydı kuyruğu dolu, kayıt atlandı: user_id=%s, mood=%s", user_id, mood)
 
     def get_functions(self) -> list[Dict[str, Any]]:
         """Emotion sistemi için function-calling kullanılmıyor"""
@@ -173,12 +600,11 @@ class EmotionChatbot:
 
     def preload_lora_model_async(self) -> None:
         """Asenkron olarak LoRA modelini önceden yükle (program başlatıldığında)"""
-        if self._lora_loading or self._lora_loaded:
+        if self._lora_loading or self._lora_ready.is_set():
             return
         
         self._lora_loading = True
         
-        import threading
         def load_in_background():
             try:
                 self._load_lora_model()
@@ -201,6 +627,7 @@ class EmotionChatbot:
         if not TRANSFORMERS_AVAILABLE:
             print("[ERROR] LoRA model yüklenemedi: transformers/peft kütüphaneleri bulunamadı")
             self._lora_loaded = True
+            self._lora_ready.set()
             return
         
         try:
@@ -215,6 +642,7 @@ class EmotionChatbot:
             if not lora_path.exists():
                 print(f"[ERROR] LoRA adaptör yolu bulunamadı: {lora_path}")
                 self._lora_loaded = True
+                self._lora_ready.set()
                 return
             
             # Adapter dosyalarını dinamik olarak kontrol et
@@ -227,32 +655,28 @@ class EmotionChatbot:
                 adapter_model_path = lora_path / "lora.safetensors"
             
             # Eğer adapter_config.json yoksa, "en iyi" klasöründen al (fallback)
+            # Config main klasörüne kopyalanmaz, doğrudan bulunduğu yerden okunur
             if not adapter_config_path.exists():
-                fallback_config_path = project_root / "Lora" / "Model" / "en iyi" / "adapter_config.json"
+                fallback_dir = project_root / "Lora" / "Model" / "en iyi"
+                fallback_config_path = fallback_dir / "adapter_config.json"
                 if fallback_config_path.exists():
                     print(f"[LoRA] adapter_config.json main klasöründe bulunamadı, 'en iyi' klasöründen kullanılıyor")
-                    # Config'i main klasörüne kopyala veya doğrudan kullan
-                    # PeftModel.from_pretrained zaten config dosyasını kendi bulabilir
-                    # Ama en güvenlisi main klasörüne kopyalamak
-                    import shutil
-                    try:
-                        shutil.copy2(fallback_config_path, adapter_config_path)
-                        print(f"[LoRA] adapter_config.json 'en iyi' klasöründen main klasörüne kopyalandı")
-                    except Exception as e:
-                        print(f"[WARNING] adapter_config.json kopyalanamadı: {e}")
-                        # Fallback olarak "en iyi" klasörünü kullan
-                        lora_path = project_root / "Lora" / "Model" / "en iyi"
-                        adapter_config_path = lora_path / "adapter_config.json"
-                        adapter_model_path = lora_path / "adapter_model.safetensors"
+                    adapter_config_path = fallback_config_path
+                    # Ağırlıklar main'de yoksa onlar da "en iyi" klasöründen alınır
+                    if not adapter_model_path.exists():
+                        lora_path = fallback_dir
+                        adapter_model_path = fallback_dir / "adapter_model.safetensors"
             
             if not adapter_config_path.exists():
                 print(f"[ERROR] adapter_config.json bulunamadı: {lora_path}")
                 self._lora_loaded = True
+                self._lora_ready.set()
                 return
             
             if not adapter_model_path.exists():
                 print(f"[ERROR] LoRA model dosyası bulunamadı (adapter_model.safetensors veya lora.safetensors): {lora_path}")
                 self._lora_loaded = True
+                self._lora_ready.set()
                 return
             
             print(f"[LoRA] Base model yükleniyor: ytu-ce-cosmos/turkish-gpt2-large")
@@ -260,112 +684,92 @@ class EmotionChatbot:
             # Base model ve tokenizer'ı yükle
             base_model_name = "ytu-ce-cosmos/turkish-gpt2-large"
             use_gpu = torch.cuda.is_available()
+            # GPU: bitsandbytes varsa INT8, yoksa fp16. CPU: destekleniyorsa bf16, yoksa fp32
+            # (ağırlık baytları azaldıkça decode sırasında okunan bellek de azalır)
+            load_in_8bit = use_gpu and BITSANDBYTES_AVAILABLE and LORA_LOAD_IN_8BIT
             
-            base_model = GPT2LMHeadModel.from_pretrained(
-                base_model_name,
-                torch_dtype=torch.float16 if use_gpu else torch.float32
-            )
+            if load_in_8bit:
+                base_model = GPT2LMHeadModel.from_pretrained(
+                    base_model_name,
+                    quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+                    device_map="auto"
+                )
+                print(f"[LoRA] Base model INT8 (bitsandbytes) olarak GPU'ya yüklendi")
+            else:
+                if use_gpu:
+                    dtype = torch.float16
+                elif hasattr(torch, "cpu") and hasattr(torch.cpu, "is_bf16_supported") and torch.cpu.is_bf16_supported():
+                    dtype = torch.bfloat16
+                else:
+                    dtype = torch.float32
+                base_model = GPT2LMHeadModel.from_pretrained(
+                    base_model_name,
+                    torch_dtype=dtype
+                )
+                print(f"[LoRA] Base model dtype: {dtype}")
             
-            if use_gpu:
+            if use_gpu and not load_in_8bit:
                 base_model = base_model.cuda()
                 print(f"[LoRA] Base model GPU'ya taşındı")
             
             # Tokenizer'ı yükle - önce local'den dene, yoksa base model'den
             tokenizer_path = lora_path / "tokenizer.json"
             if tokenizer_path.exists():
-                tokenizer = AutoTokenizer.from_pretrained(str(lora_path))
+                tokenizer = _load_lora_tokenizer(str(lora_path))
             else:
-                tokenizer = AutoTokenizer.from_pretrained(base_model_name)
+                tokenizer = _load_lora_tokenizer(base_model_name)
             
             # Pad token ekle (eğer yoksa)
             if tokenizer.pad_token is None:
                 tokenizer.pad_token = tokenizer.eos_token if hasattr(tokenizer, 'eos_token') and tokenizer.eos_token else tokenizer.add_special_tokens({'pad_token': '[PAD]'})
+            # Batch generation için soldan padding: üretim tüm satırlarda son pozisyondan başlar
+            tokenizer.padding_side = "left"
             
             print("[LoRA] Base model yüklendi, LoRA adaptörü ekleniyor...")
             
             # LoRA adaptörünü base model üzerine tak
-            # Windows path sorununu çözmek için: local path için from_pretrained yerine load_adapter kullan
-            try:
-                # Önce from_pretrained ile dene
-                lora_path_str = str(lora_path.resolve())
-                self.lora_model = PeftModel.from_pretrained(
-                    base_model,
-                    lora_path_str,
-                    device_map="auto" if use_gpu else None
-                )
-            except Exception as e:
-                # Eğer path validation hatası varsa, manuel yükleme yap
-                error_str = str(e).lower()
-                if "repo id" in error_str or "hfvalidationerror" in error_str or "validation" in error_str:
-                    print(f"[LoRA] Path validation hatası, manuel yükleme deneniyor...")
-                    try:
-                        from peft import PeftConfig
-                        # Config dosyasını oku
-                        import json
-                        with open(adapter_config_path, 'r', encoding='utf-8') as f:
-                            config_dict = json.load(f)
-                        
-                        # PeftModel oluştur (base model + config)
-                        config = PeftConfig.from_dict(config_dict)
-                        self.lora_model = PeftModel(base_model, config, adapter_name="default")
-                        
-                        # Weight dosyasını yükle (adapter_model.safetensors veya lora.safetensors)
-                        if adapter_model_path.exists():
-                            print(f"[LoRA] Weight dosyası yükleniyor: {adapter_model_path.name}")
-                            if str(adapter_model_path).endswith('.safetensors'):
-                                try:
-                                    from safetensors.torch import load_file
-                                    state_dict = load_file(str(adapter_model_path))
-                                    print(f"[LoRA] Safetensors dosyası başarıyla yüklendi")
-                                except ImportError:
-                                    print(f"[LoRA WARNING] safetensors.torch bulunamadı, torch ile deneniyor...")
-                                    import torch
-                                    # .safetensors dosyasını torch.load ile açmaya çalışma, hata verir
-                                    raise ImportError("safetensors kütüphanesi gerekli (.safetensors dosyası için)")
-                            else:
-                                import torch
-                                state_dict = torch.load(str(adapter_model_path), map_location='cpu')
-                            
-                            # PEFT'in beklediği format: adapter_model.safetensors zaten doğru formatta olmalı
-                            # Eğer key'ler base_model.model. ile başlıyorsa olduğu gibi bırak
-                            # Eğer lora_ ile başlıyorsa default. prefix'i ekle
-                            peft_state_dict = {}
-                            for key, value in state_dict.items():
-                                if key.startswith('base_model.model.'):
-                                    # Base model key'leri olduğu gibi bırak
-                                    peft_state_dict[key] = value
-                                elif 'lora_' in key or 'default.' in key:
-                                    # LoRA key'leri - zaten doğru formatta olabilir
-                                    if key.startswith('default.'):
-                                        peft_state_dict[key] = value
-                                    else:
-                                        # default. prefix'i ekle
-                                        peft_state_dict[f'default.{key}'] = value
-                                else:
-                                    # Diğer key'leri de ekle
-                                    peft_state_dict[key] = value
-                            
-                            # State dict'i yükle
-                            print(f"[LoRA] State dict yükleniyor ({len(peft_state_dict)} key)...")
-                            missing_keys, unexpected_keys = self.lora_model.load_state_dict(peft_state_dict, strict=False)
-                            if missing_keys:
-                                print(f"[LoRA WARNING] Eksik keys: {len(missing_keys)} adet (ilk 5: {missing_keys[:5]})")
-                            if unexpected_keys:
-                                print(f"[LoRA WARNING] Beklenmeyen keys: {len(unexpected_keys)} adet (ilk 5: {unexpected_keys[:5]})")
-                            print("[LoRA] Adapter manuel yükleme ile başarıyla yüklendi")
-                        else:
-                            raise Exception(f"Adapter weight dosyası bulunamadı: {adapter_model_path}")
-                    except Exception as e2:
-                        print(f"[ERROR] Manuel yükleme de başarısız oldu: {e2}")
-                        import traceback
-                        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+            if adapter_config_path.parent != adapter_model_path.parent:
+                # Config ve ağırlıklar farklı klasörlerde: from_pretrained tek klasör beklediği için manuel yükleme
+                self.lora_model = self._load_adapter_manually(base_model, adapter_config_path, adapter_model_path)
+            else:
+                # Windows path sorununu çözmek için: path validation hatasında manuel yüklemeye geçilir
+                try:
+                    # Önce from_pretrained ile dene
+                    lora_path_str = str(adapter_config_path.parent.resolve())
+                    self.lora_model = PeftModel.from_pretrained(
+                        base_model,
+                        lora_path_str,
+                        device_map="auto" if use_gpu else None
+                    )
+                except Exception as e:
+                    # Eğer path validation hatası varsa, manuel yükleme yap
+                    error_str = str(e).lower()
+                    if "repo id" in error_str or "hfvalidationerror" in error_str or "validation" in error_str:
+                        print(f"[LoRA] Path validation hatası, manuel yükleme deneniyor...")
+                        try:
+                            self.lora_model = self._load_adapter_manually(base_model, adapter_config_path, adapter_model_path)
+                        except Exception as e2:
+                            print(f"[ERROR] Manuel yükleme de başarısız oldu: {e2}")
+                            import traceback
+                            print(f"[ERROR] Traceback: {traceback.format_exc()}")
+                            raise e
+                    else:
+                        # Diğer hatalar için original hatayı fırlat
                         raise e
-                else:
-                    # Diğer hatalar için original hatayı fırlat
-                    raise e
             
             self.lora_tokenizer = tokenizer
             
+            # Token ID'leri ve güvenli max_length tokenizer'a göre sabittir, her istekte yeniden hesaplanmaz
+            if tokenizer.pad_token_id is not None:
+                self._pad_id = int(tokenizer.pad_token_id)
+            elif tokenizer.eos_token_id is not None:
+                self._pad_id = int(tokenizer.eos_token_id)
+            else:
+                self._pad_id = 0
+            self._eos_id = int(tokenizer.eos_token_id) if tokenizer.eos_token_id is not None else self._pad_id
+            model_max_len = getattr(tokenizer, 'model_max_length', 512)
+            self._safe_max_len = min(512, model_max_len) if model_max_len < 10000 else 512
+            
             # Model tipini ve LoRA durumunu kontrol et
             if hasattr(self.lora_model, 'peft_config'):
                 print(f"[LoRA] LoRA adaptörü başarıyla eklendi")
@@ -373,7 +777,51 @@ class EmotionChatbot:
                 print("[WARNING] LoRA adaptörü eklenmiş gibi görünmüyor, PEFT config bulunamadı")
             
             self.lora_model.eval()  # Inference modu
+            
+            # Sadece inference yapıldığı için LoRA ağırlıkları base model'e gömülür:
+            # her katmandaki ek A·B matmul'ları kalkar (adaptör sonradan değiştirilemez, tek adaptör için yeterli)
+            # INT8 base model'de birleştirme yapılmaz (bitsandbytes ağırlıklarına LoRA eklenemez)
+            if not load_in_8bit:
+                try:
+                    self.lora_model = self.lora_model.merge_and_unload()
+                    self.lora_model.eval()
+                    print("[LoRA] Adaptör ağırlıkları base model ile birleştirildi (merge_and_unload)")
+                except Exception as e:
+                    print(f"[LoRA WARNING] Adaptör birleştirilemedi, PEFT modeli ile devam ediliyor: {e}")
+            
+            # GPU'da girdiler için pinned host tamponları bir kez ayrılır (en büyük batch x en uzun kova);
+            # her istekte yeni tensör ayırmak yerine bu tamponlara yazılıp asenkron kopyalanır
+            if use_gpu:
+                try:
+                    buffer_size = LORA_MAX_BATCH_SIZE * max(LORA_PROMPT_BUCKETS)
+                    self._host_ids = torch.empty(buffer_size, dtype=torch.long, pin_memory=True)
+                    self._host_mask = torch.empty(buffer_size, dtype=torch.long, pin_memory=True)
+                except Exception as e:
+                    print(f"[LoRA WARNING] Pinned host tamponları ayrılamadı: {e}")
+                    self._host_ids = self._host_mask = None
+            
+            # GPU'da forward derlenir; generate aynı model üzerinden derlenmiş forward'ı çağırır
+            # (INT8 bitsandbytes katmanları CUDA graph ile uyumlu olmadığından derlenmez)
+            if use_gpu and LORA_TORCH_COMPILE and not load_in_8bit:
+                self._lora_eager_forward = self.lora_model.forward
+                try:
+                    # Her (batch kovası, prompt kovası) çifti için prefill + decode grafiği derlenir; dynamo'nun
+                    # varsayılan yeniden derleme sınırı aşılıp sessizce eager'a düşülmemesi için sınır yükseltilir
+                    import torch._dynamo
+                    shape_count = 2 * len(LORA_BATCH_BUCKETS) * len(LORA_PROMPT_BUCKETS)
+                    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, shape_count)
+                    self.lora_model.forward = torch.compile(self.lora_model.forward, mode="reduce-overhead", fullgraph=False)
+                    self._lora_compiled = True
+                    self._lora_static_cache = True
+                    print("[LoRA] Model forward'ı torch.compile ile derlendi, ısınma üretimi yapılıyor...")
+                    # Derleme maliyeti ilk kullanıcı isteğinden önce (yükleme sırasında) ödenir; static cache
+                    # boyutu prompt + max_new_tokens olduğundan ısınma gerçek isteklerle aynı max_new_tokens'ı kullanır
+                    self._generate_batch(["Merhaba"], max_new_tokens=LORA_MAX_NEW_TOKENS)
+                except Exception as e:
+                    print(f"[LoRA WARNING] torch.compile kullanılamadı, derlenmemiş model ile devam ediliyor: {e}")
+                    self._disable_lora_compile()
             self._lora_loaded = True
+            self._lora_ready.set()
             
             # Model bilgilerini yazdır
             if use_gpu:
@@ -384,129 +832,271 @@ class EmotionChatbot:
             import traceback
             print(f"[ERROR] Traceback: {traceback.format_exc()}")
             self._lora_loaded = True
+            self._lora_ready.set()
+    
+    def _load_adapter_manually(self, base_model, adapter_config_path: Path, adapter_model_path: Path):
+        """Adaptör config'ini ve ağırlıklarını (ayrı klasörlerde olabilirler) okuyup base model'e PeftModel olarak takar"""
+        from peft import PeftConfig
+        # Config dosyasını oku
+        with open(adapter_config_path, 'r', encoding='utf-8') as f:
+            config_dict = json.load(f)
+        
+        # PeftModel oluştur (base model + config)
+        config = PeftConfig.from_dict(config_dict)
+        lora_model = PeftModel(base_model, config, adapter_name="default")
+        
+        # Weight dosyasını yükle (adapter_model.safetensors veya lora.safetensors)
+        # Ağırlıklar doğrudan base model'in cihazına okunur (CPU'da ara kopya oluşmaz)
+        device = next(base_model.parameters()).device
+        if adapter_model_path.exists():
+            print(f"[LoRA] Weight dosyası yükleniyor: {adapter_model_path.name} -> {device}")
+            if str(adapter_model_path).endswith('.safetensors'):
+                try:
+                    from safetensors.torch import load_file
+                    state_dict = load_file(str(adapter_model_path), device=str(device))
+                    print(f"[LoRA] Safetensors dosyası başarıyla yüklendi")
+                except ImportError:
+                    print(f"[LoRA WARNING] safetensors.torch bulunamadı, torch ile deneniyor...")
+                    import torch
+                    # .safetensors dosyasını torch.load ile açmaya çalışma, hata verir
+                    raise ImportError("safetensors kütüphanesi gerekli (.safetensors dosyası için)")
+            else:
+                import torch
+                state_dict = torch.load(str(adapter_model_path), map_location=device)
+            
+            # PEFT'in beklediği format: adapter_model.safetensors zaten doğru formatta olmalı
+            # Eğer key'ler base_model.model. ile başlıyorsa olduğu gibi bırak
+            # Eğer lora_ ile başlıyorsa default. prefix'i ekle
+            peft_state_dict = {}
+            for key, value in state_dict.items():
+                if key.startswith('base_model.model.'):
+                    # Base model key'leri olduğu gibi bırak
+                    peft_state_dict[key] = value
+                elif 'lora_' in key or 'default.' in key:
+                    # LoRA key'leri - zaten doğru formatta olabilir
+                    if key.startswith('default.'):
+                        peft_state_dict[key] = value
+                    else:
+                        # default. prefix'i ekle
+                        peft_state_dict[f'default.{key}'] = value
+                else:
+                    # Diğer key'leri de ekle
+                    peft_state_dict[key] = value
+            
+            # State dict'i yükle
+            print(f"[LoRA] State dict yükleniyor ({len(peft_state_dict)} key)...")
+            missing_keys, unexpected_keys = lora_model.load_state_dict(peft_state_dict, strict=False)
+            if missing_keys:
+                print(f"[LoRA WARNING] Eksik keys: {len(missing_keys)} adet (ilk 5: {missing_keys[:5]})")
+            if unexpected_keys:
+                print(f"[LoRA WARNING] Beklenmeyen keys: {len(unexpected_keys)} adet (ilk 5: {unexpected_keys[:5]})")
+            print("[LoRA] Adapter manuel yükleme ile başarıyla yüklendi")
+        else:
+            raise Exception(f"Adapter weight dosyası bulunamadı: {adapter_model_path}")
+        
+        return lora_model
     
-    def _generate_with_lora(self, prompt: str, max_new_tokens: int = 40) -> str:
-        """LoRA modelinden metin üretir - sadece kullanıcı mesajını kullanır"""
+    def _generate_with_lora(self, prompt: str, max_new_tokens: int = LORA_MAX_NEW_TOKENS) -> str:
+        """
+        LoRA modelinden metin üretir - sadece kullanıcı mesajını kullanır.
+        İstek dispatcher thread'ine gönderilir; kısa bir pencere içinde gelen eşzamanlı
+        istekler tek generate çağrısında birlikte üretilir.
+        """
         if not TRANSFORMERS_AVAILABLE or self.lora_model is None or self.lora_tokenizer is None:
             return ""
         
+        self._ensure_gen_dispatcher()
+        future: "concurrent.futures.Future[str]" = concurrent.futures.Future()
+        self._gen_queue.put((prompt, int(max_new_tokens), future))
         try:
-            import torch
-            import re
+            return future.result(timeout=LORA_GENERATE_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # Henüz üretime alınmadıysa iptal edilir; dispatcher iptal edilen istekleri atlar
+            future.cancel()
+            log.error("[ERROR] LoRA metin üretme zaman aşımı (%d sn)", LORA_GENERATE_TIMEOUT)
+            return ""
+        except Exception as e:
+            log.error("[ERROR] LoRA metin üretme hatası: %s", e)
+            return ""
+    
+    def _ensure_gen_dispatcher(self) -> None:
+        """Üretim dispatcher thread'ini ilk kullanımda başlatır"""
+        if self._gen_thread is not None and self._gen_thread.is_alive():
+            return
+        with self._gen_thread_lock:
+            if self._gen_thread is None or not self._gen_thread.is_alive():
+                self._gen_thread = threading.Thread(target=self._gen_dispatch_loop, name="lora-generate", daemon=True)
+                self._gen_thread.start()
+    
+    def _gen_dispatch_loop(self) -> None:
+        """Kuyruktaki prompt'ları LORA_BATCH_WINDOW içinde toplayıp batch halinde üretir"""
+        while True:
+            pending = [self._gen_queue.get()]
+            deadline = time.monotonic() + LORA_BATCH_WINDOW
+            while len(pending) < LORA_MAX_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._gen_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
             
-            # Prompt'u tokenize et
-            model_max_len = getattr(self.lora_tokenizer, 'model_max_length', 512)
-            safe_max_length = min(512, model_max_len) if model_max_len < 10000 else 512
+            # Aynı max_new_tokens ile gelen istekler birlikte üretilir; beklerken zaman aşımına uğrayıp
+            # iptal edilen istekler üretilmez
+            groups: Dict[int, list] = {}
+            for item in pending:
+                if item[2].set_running_or_notify_cancel():
+                    groups.setdefault(item[1], []).append(item)
             
+            for max_new_tokens, items in groups.items():
+                try:
+                    responses = self._generate_batch([prompt for prompt, _, _ in items], max_new_tokens)
+                    for (_, _, future), response in zip(items, responses):
+                        future.set_result(response)
+                except Exception as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+    
+    def _generate_batch(self, prompts: list[str], max_new_tokens: int) -> list[str]:
+        """Prompt listesini soldan pad'leyip tek generate çağrısıyla üretir, temizlenmiş cevapları döndürür"""
+        import torch
+        
+        # Prompt'ları tokenize et
+        safe_max_length = self._safe_max_len
+        
+        if self._lora_compiled:
+            # Derlenmiş model: batch boyutu kovaya tamamlanır (dolgu satırları ilk prompt'un kopyasıdır,
+            # tamamen maskeli satır örneklemede NaN üretebilir) ve en uzun prompt'un kovasına soldan pad'lenir
+            batch_bucket = next((b for b in LORA_BATCH_BUCKETS if b >= len(prompts)), len(prompts))
+            padded_prompts = prompts + [prompts[0]] * (batch_bucket - len(prompts))
+            encoded = self.lora_tokenizer(padded_prompts, truncation=True, max_length=safe_max_length)
+            longest = max(len(ids) for ids in encoded["input_ids"])
+            bucket = next((b for b in LORA_PROMPT_BUCKETS if b >= longest), safe_max_length)
+            encoded = self.lora_tokenizer.pad(encoded, padding="max_length", max_length=bucket, return_tensors="pt")
+        else:
             encoded = self.lora_tokenizer(
-                prompt,
+                prompts,
                 return_tensors="pt",
                 padding=True,
                 truncation=True,
                 max_length=safe_max_length
             )
-            input_ids = encoded.input_ids
-            attention_mask = encoded.attention_mask
-            input_length = input_ids.shape[-1]
-            
-            # GPU'ya taşı (varsa)
-            if torch.cuda.is_available():
+        input_ids = encoded.input_ids
+        attention_mask = encoded.attention_mask
+        input_length = input_ids.shape[-1]
+        
+        # GPU'ya taşı (varsa)
+        if torch.cuda.is_available():
+            if self._host_ids is not None and input_ids.numel() <= self._host_ids.numel():
+                # Pinned tampona yaz, oradan non_blocking kopyala (dispatcher tek thread: tampon paylaşılmaz)
+                n = input_ids.numel()
+                input_ids = self._host_ids[:n].view_as(input_ids).copy_(input_ids).cuda(non_blocking=True)
+                attention_mask = self._host_mask[:n].view_as(attention_mask).copy_(attention_mask).cuda(non_blocking=True)
+            else:
                 input_ids = input_ids.cuda()
                 attention_mask = attention_mask.cuda()
-            else:
-                device = None
-                if hasattr(self.lora_model, 'device'):
-                    device = self.lora_model.device
-                elif hasattr(self.lora_model, 'base_model'):
-                    if hasattr(self.lora_model.base_model, 'device'):
-                        device = self.lora_model.base_model.device
-                
-                if device is not None:
-                    input_ids = input_ids.to(device)
-                    attention_mask = attention_mask.to(device)
-            
-            # Token ID'lerini güvenli şekilde belirle
-            if self.lora_tokenizer.pad_token_id is not None:
-                pad_token_id = int(self.lora_tokenizer.pad_token_id)
-            elif self.lora_tokenizer.eos_token_id is not None:
-                pad_token_id = int(self.lora_tokenizer.eos_token_id)
-            else:
-                pad_token_id = 0
+        else:
+            device = None
+            if hasattr(self.lora_model, 'device'):
+                device = self.lora_model.device
+            elif hasattr(self.lora_model, 'base_model'):
+                if hasattr(self.lora_model.base_model, 'device'):
+                    device = self.lora_model.base_model.device
             
-            if self.lora_tokenizer.eos_token_id is not None:
-                eos_token_id = int(self.lora_tokenizer.eos_token_id)
-            elif self.lora_tokenizer.pad_token_id is not None:
-                eos_token_id = int(self.lora_tokenizer.pad_token_id)
+            if device is not None:
+                input_ids = input_ids.to(device)
+                attention_mask = attention_mask.to(device)
+        
+        # Text generation parametreleri (token ID'leri yüklemede bir kez belirlendi)
+        min_length_value = min(input_length + 3, safe_max_length)
+        
+        gen_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=int(max_new_tokens),
+            min_length=int(min_length_value),
+            do_sample=True,
+            repetition_penalty=float(1.2),
+            no_repeat_ngram_size=int(0),
+            top_k=int(50),
+            top_p=float(0.95),
+            temperature=float(0.8),
+            pad_token_id=self._pad_id,
+            eos_token_id=self._eos_id
+        )
+        
+        outputs = None
+        # inference_mode: no_grad'a ek olarak version counter/view takibi de kapatılır
+        with torch.inference_mode():
+            if self._lora_static_cache:
+                # Sabit boyutlu KV cache: derlenmiş forward her adımda aynı şekilleri görür
+                try:
+                    outputs = self.lora_model.generate(**gen_kwargs, cache_implementation="static")
+                except Exception as e:
+                    # Model/transformers sürümü static cache desteklemiyorsa dinamik cache'e dönülür; dinamik cache'te
+                    # şekiller her adımda değiştiğinden derlenmiş (CUDA graph) forward da bırakılır
+                    print(f"[LoRA WARNING] Static KV cache kullanılamadı, derlenmemiş model ve dinamik cache ile devam ediliyor: {e}")
+                    self._disable_lora_compile()
+            if outputs is None:
+                outputs = self.lora_model.generate(**gen_kwargs)
+        
+        # Sadece modelin ürettiği yanıtları al (soldan padding: tüm satırlarda prompt aynı uzunlukta)
+        # Batch kovası için eklenen dolgu satırları decode edilmez
+        generated_responses = self.lora_tokenizer.batch_decode(outputs[:len(prompts), input_length:], skip_special_tokens=True)
+        return [self._clean_lora_response(prompt, response) for prompt, response in zip(prompts, generated_responses)]
+    
+    def _disable_lora_compile(self) -> None:
+        """Derlenmiş forward'ı bırakıp derleme öncesi (eager) forward'a ve dinamik cache'e döner"""
+        if self._lora_eager_forward is not None:
+            self.lora_model.forward = self._lora_eager_forward
+            self._lora_eager_forward = None
+        self._lora_compiled = False
+        self._lora_static_cache = False
+    
+    def _clean_lora_response(self, prompt: str, generated_response: str) -> str:
+        """LoRA çıktısından EOS sonrası, rol önekleri, prompt tekrarı ve fazla emojileri temizler"""
+        # EOS token'dan sonrasını temizle
+        if self.lora_tokenizer.eos_token:
+            generated_response = generated_response.split(self.lora_tokenizer.eos_token)[0].strip()
+        
+        generated_text = generated_response
+        
+        # Post-processing: "assistant:" ve "user:" öneklerini temizle
+        assistant_match = _ASSISTANT_ROLE_RE.search(generated_text)
+        if assistant_match:
+            generated_text = generated_text[assistant_match.end():].strip()
+        
+        user_match = _USER_ROLE_RE.search(generated_text)
+        if user_match:
+            generated_text = generated_text[user_match.end():].strip()
+        
+        # Prompt içeriyorsa temizle (ilk geçiş tek taramada bulunur ve çıkarılır)
+        prompt_stripped = prompt.strip()
+        if prompt_stripped:
+            before, found, after = generated_text.partition(prompt_stripped)
+            if found:
+                generated_text = (before + after).strip()
+        
+        # Virgülle başlayan metinleri temizle
+        if generated_text.startswith(','):
+            parts = generated_text.split(',', 1)
+            if len(parts) > 1:
+                generated_text = parts[1].strip()
             else:
-                eos_token_id = pad_token_id
-            
-            # Text generation parametreleri
-            min_length_value = input_length + 3
-            max_possible_length = safe_max_length if safe_max_length < 10000 else 512
-            min_length_value = min(min_length_value, max_possible_length)
-            
-            with torch.no_grad():
-                outputs = self.lora_model.generate(
-                    input_ids=input_ids,
-                    attention_mask=attention_mask,
-                    max_new_tokens=int(max_new_tokens),
-                    min_length=int(min_length_value),
-                    do_sample=True,
-                    repetition_penalty=float(1.2),
-                    no_repeat_ngram_size=int(0),
-                    top_k=int(50),
-                    top_p=float(0.95),
-                    temperature=float(0.8),
-                    pad_token_id=int(pad_token_id),
-                    eos_token_id=int(eos_token_id)
-                )
-            
-            # Sadece modelin ürettiği yanıtı al (prompt'u çıkar)
-            response_ids = outputs[0][input_ids.shape[-1]:]
-            generated_response = self.lora_tokenizer.decode(response_ids, skip_special_tokens=True)
-            
-            # EOS token'dan sonrasını temizle
-            if self.lora_tokenizer.eos_token:
-                generated_response = generated_response.split(self.lora_tokenizer.eos_token)[0].strip()
-            
-            generated_text = generated_response
-            
-            # Post-processing: "assistant:" ve "user:" öneklerini temizle
-            assistant_match = re.search(r'assistant\s*:\s*', generated_text, flags=re.IGNORECASE)
-            if assistant_match:
-                generated_text = generated_text[assistant_match.end():].strip()
-            
-            user_match = re.search(r'user\s*:\s*', generated_text, flags=re.IGNORECASE)
-            if user_match:
-                generated_text = generated_text[user_match.end():].strip()
-            
-            # Prompt içeriyorsa temizle
-            if prompt.strip() in generated_text:
-                generated_text = generated_text.replace(prompt.strip(), "", 1).strip()
-            
-            # Virgülle başlayan metinleri temizle
-            if generated_text.startswith(','):
-                parts = generated_text.split(',', 1)
-                if len(parts) > 1:
-                    generated_text = parts[1].strip()
-                else:
-                    generated_text = generated_text.lstrip(',').strip()
-            
-            # Prompt'un ilk birkaç kelimesini kontrol et ve varsa çıkar
-            prompt_words = prompt.strip().split()[:5]
-            if len(prompt_words) >= 3:
-                prompt_prefix = ' '.join(prompt_words)
-                if generated_text.startswith(prompt_prefix):
-                    generated_text = generated_text[len(prompt_prefix):].strip()
-            
-            # Emoji sayısını sınırla (en fazla 1 emoji)
-            generated_text = self._limit_emoji_count(generated_text, max_emojis=1)
-            
-            return generated_text
-            
-        except Exception as e:
-            print(f"[ERROR] LoRA metin üretme hatası: {e}")
-            return ""
+                generated_text = generated_text.lstrip(',').strip()
+        
+        # Prompt'un ilk birkaç kelimesini kontrol et ve varsa çıkar
+        prompt_words = prompt_stripped.split()[:5]
+        if len(prompt_words) >= 3:
+            prompt_prefix = ' '.join(prompt_words)
+            if generated_text.startswith(prompt_prefix):
+                generated_text = generated_text[len(prompt_prefix):].strip()
+        
+        # Emoji sayısını sınırla (en fazla 1 emoji)
+        generated_text = self._limit_emoji_count(generated_text, max_emojis=1)
+        
+        return generated_text
     
     def _check_static_response(self, user_message: str) -> Optional[str]:
         """Kullanıcı mesajı için statik cevap kontrolü yapar (gizli)"""
@@ -515,7 +1105,7 @@ class EmotionChatbot:
         
         # Mesajı normalize et (küçük harf, boşlukları temizle, noktalama işaretlerini kaldır)
         normalized = user_message.lower().strip()
-        normalized = re.sub(r'\s+', ' ', normalized)
+        normalized = _WS_RE.sub(' ', normalized)
         normalized_clean = re.sub(r'[.,!?;:]', '', normalized)  # Noktalama işaretlerini kaldır
         
         # Direkt eşleşme kontrolü (noktalama işareti olmadan)
@@ -560,73 +1150,27 @@ class EmotionChatbot:
     
     def _limit_emoji_count(self, text: str, max_emojis: int = 1) -> str:
         """Metindeki emoji sayısını sınırlar - dataset'e uygun"""
-        import re
-        
-        # Unicode emoji pattern'i
-        emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F1E0-\U0001F1FF"  # flags
-            "\U00002702-\U000027B0"
-            "\U000024C2-\U0001F251"
-            "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-            "\U0001FA00-\U0001FAFF"  # Chess Symbols
-            "\U00002600-\U000026FF"  # Miscellaneous Symbols
-            "\U00002700-\U000027BF"  # Dingbats
-            "]+",
-            flags=re.UNICODE
-        )
-        
-        # Tüm emoji bloklarını bul
-        emoji_blocks = []
-        i = 0
-        while i < len(text):
-            if emoji_pattern.match(text[i]):
-                start = i
-                end = i + 1
-                while end < len(text):
-                    if text[end] == '\u200d' and end + 1 < len(text):
-                        if emoji_pattern.match(text[end + 1]):
-                            end += 2
-                        else:
-                            break
-                    elif emoji_pattern.match(text[end]):
-                        end += 1
-                    else:
-                        break
-                emoji_blocks.append((start, end))
-                i = end
-            else:
-                i += 1
+        # Tüm emoji blokları (ZWJ ile birleşik diziler dahil) tek regex geçişinde bulunur
+        emoji_blocks = list(_EMOJI_SEQ_RE.finditer(text))
         
         # Emoji sayısı max_emojis'den fazlaysa sadece ilk max_emojis kadarını tut
         if len(emoji_blocks) > max_emojis:
-            parts = []
-            last_end = 0
-            
-            for idx, (start, end) in enumerate(emoji_blocks[:max_emojis]):
-                if last_end < start:
-                    parts.append(text[last_end:start])
-                last_end = end
+            kept = emoji_blocks[:max_emojis]
+            last_end = kept[-1].end() if kept else 0
+            # Tutulan blokların öncesi: sadece bu bloklar çıkarılır
+            head = _EMOJI_SEQ_RE.sub('', text[:last_end])
+            # Sonrası: kalan tüm emojiler ve ZWJ karakterleri silinir
+            remaining = _EMOJI_PATTERN.sub('', text[last_end:]).replace(_ZWJ, '')
+            kept_emojis = ''.join(m.group() for m in kept)
             
-            if last_end < len(text):
-                remaining = text[last_end:]
-                remaining = emoji_pattern.sub('', remaining)
-                remaining = remaining.replace('\u200d', '')
-                parts.append(remaining)
-            
-            kept_emojis = ''.join(text[start:end] for start, end in emoji_blocks[:max_emojis])
-            
-            result = ''.join(parts).strip()
+            result = (head + remaining).strip()
             if kept_emojis:
                 result = (result + ' ' + kept_emojis).strip() if result else kept_emojis
             
             text = result
         
         # Fazla boşlukları temizle
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WS_RE.sub(' ', text).strip()
         
         return text
 
@@ -646,26 +1190,23 @@ class EmotionChatbot:
         self.stats["requests"] += 1
         self.stats["last_request_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+        # Kullanıcı duygusunu açıkça söylüyorsa duygu yerel olarak belirlenir, LLM çağrısı yapılmaz
+        keyword_mood = match_mood_keyword(user_message)
+        
         # ADIM 1: Statik cevapları kontrol et (gizli - LoRA çağrısından önce)
         static_response = self._check_static_response(user_message)
-        if static_response:
-            # Statik cevap bulundu, LoRA çağrısı yapmadan direkt kullan
-            lora_response = static_response
-        else:
-            # Statik cevap yok, LoRA modelinden cevap al
-            print("[EMOTION] LoRA modelinden cevap alınıyor...")
+        if not static_response:
+            # Statik cevap yok, LoRA modelinden cevap alınacak
+            log.debug("[EMOTION] LoRA modelinden cevap alınıyor...")
             
             # LoRA modeli önceden yüklenmiş olmalı, kontrol et
-            if not self._lora_loaded:
+            if not self._lora_ready.is_set():
                 if self._lora_loading:
-                    print("[EMOTION] LoRA modeli hala yükleniyor, bekleniyor...")
-                    import time
-                    for _ in range(60):
-                        if self._lora_loaded:
-                            break
-                        time.sleep(1)
-                if not self._lora_loaded:
-                    print("[EMOTION] LoRA modeli yüklenmedi, şimdi yükleniyor...")
+                    log.info("[EMOTION] LoRA modeli hala yükleniyor, bekleniyor...")
+                    # Yükleme biter bitmez uyanır (en fazla 60 sn)
+                    self._lora_ready.wait(timeout=60)
+                if not self._lora_ready.is_set():
+                    log.info("[EMOTION] LoRA modeli yüklenmedi, şimdi yükleniyor...")
                     self._load_lora_model()
             
             if not TRANSFORMERS_AVAILABLE or self.lora_model is None:
@@ -675,113 +1216,59 @@ class EmotionChatbot:
                 import torch
             except ImportError:
                 return {"response": "LoRA model yüklenemedi. Lütfen torch kütüphanesini yükleyin."}
-            
+        
+        # Duygu analizi (ücretli LLM çağrısı) ancak model kontrolleri geçildikten sonra, LoRA üretimini
+        # beklemeden sadece kullanıcı mesajıyla başlatılır (ağ çağrısı GPU üretimiyle örtüşür)
+        mood_future = None if keyword_mood else self._mood_pool.submit(self._classify_mood_cached, user_message)
+        
+        if static_response:
+            # Statik cevap bulundu, LoRA çağrısı yapmadan direkt kullan
+            lora_response = static_response
+        else:
             # LoRA'ya sadece kullanıcının mesajını gönder
-            lora_response = self._generate_with_lora(user_message, max_new_tokens=40)
+            lora_response = self._generate_with_lora(user_message, max_new_tokens=LORA_MAX_NEW_TOKENS)
             
             if not lora_response:
+                if mood_future is not None:
+                    # Henüz başlamadıysa LLM çağrısı hiç yapılmaz (başladıysa sonucu önbellekte kalır)
+                    mood_future.cancel()
                 return {"response": "LoRA modelinden cevap alınamadı."}
             
-            print(f"[EMOTION] LoRA cevabı: {lora_response[:100]}...")
-        
-        # ADIM 2: LLM'den duygu analizi (kullanıcı mesajı + LoRA cevabı)
-        print("[EMOTION] LLM'den duygu analizi yapılıyor...")
+            log.debug("[EMOTION] LoRA cevabı: %.100s...", lora_response)
         
-        emotion_prompt = f"""Görev: Verilen kullanıcı mesajını ve asistan cevabını analiz et ve sadece 1 duygu belirle.
-
-Kullanıcı mesajı: "{user_message}"
-Asistan cevabı: "{lora_response}"
-
-Sadece aşağıdaki JSON formatını döndür, başka hiçbir şey yazma:
-
-{{"ruh_hali": "Mutlu"}}
-
-Seçilebilecek ruh halleri (sadece bu listeden seç):
-- Mutlu
-- Üzgün
-- Öfkeli
-- Şaşkın
-- Utanmış
-- Endişeli
-- Gülümseyen
-- Flörtöz
-- Sorgulayıcı
-- Yorgun
-
-ÖNEMLİ TALİMATLAR:
-1. Kullanıcı mesajındaki duygu ifadeleri daima birinci önceliktir. Kullanıcı kendini 'üzgün' olarak tanımlıyorsa, asistan cevabı ne olursa olsun 'Üzgün' seçmelisin.
-2. Asistan cevabı, kullanıcıya verilen yanıtı temsil eder ve bağlamı pekiştirmek içindir.
-3. Girdi formatı dışında hiçbir metin yazma, yalnızca tek bir JSON nesnesi döndür."""
-        
-        messages_payload: list[Dict[str, Any]] = [
-            {"role": "system", "content": "Sen bir duygu analiz asistanısın. Verilen metni analiz edip sadece JSON formatında duygu döndürürsün. Başka hiçbir şey yazmazsın."},
-            {"role": "user", "content": emotion_prompt}
-        ]
-        
-        # LLM'den duygu analizi al
-        try:
-            if self.use_gemini:
-                import google.generativeai as genai
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                prompt_text = self._convert_messages_to_prompt(messages_payload)
-                response = model.generate_content(prompt_text)
-                emotion_content = response.text
-                print(f"[EMOTION] Gemini duygu cevabı: {emotion_content}")
-            else:
-                completion = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=messages_payload,
-                    temperature=0.2,
-                )
-                emotion_content = completion.choices[0].message.content or ""
-        except Exception as e:
-            print(f"[ERROR] LLM duygu analizi hatası: {e}")
-            emotion_content = json.dumps({
-                "ruh_hali": random.choice(["Mutlu", "Üzgün", "Şaşkın"])
-            })
-        
-        # JSON çıkar
-        def extract_json_object(text: str) -> Dict[str, Any] | None:
-            t = text.replace("```json", "").replace("```", "").strip()
-            start = t.find('{')
-            if start == -1:
-                return None
-            depth = 0
-            in_string = False
-            escape = False
-            end_index = -1
-            for i in range(start, len(t)):
-                ch = t[i]
-                if in_string:
-                    if escape:
-                        escape = False
-                    elif ch == '\\':
-                        escape = True
-                    elif ch == '"':
-                        in_string = False
-                else:
-                    if ch == '"':
-                        in_string = True
-                    elif ch == '{':
-                        depth += 1
-                    elif ch == '}':
-                        depth -= 1
-                        if depth == 0:
-                            end_index = i
-                            break
-            if end_index == -1:
-                return None
-            candidate = t[start:end_index + 1]
-            try:
-                return json.loads(candidate)
-            except Exception:
-                return None
+        # ADIM 2: LLM'den duygu analizi
+        # Kullanıcı mesajıyla yapılan tahmin (ADIM 1'le eşzamanlı başlatıldı) geçerli bir duygu döndürdüyse
+        # kullanılır; aksi halde kullanıcı mesajı + LoRA cevabı ile tam analiz yapılır.
+        # Bilinçli ödünleşim: Gemini/OpenAI JSON modunda (Gemini'de enum şemasıyla) çağrıldığından tahmin
+        # pratikte her zaman geçerli bir duygudur; LoRA cevabıyla yeniden analiz sadece LLM hata verdiğinde
+        # veya beklenmeyen bir cevap döndürdüğünde yapılır. Duygu kullanıcı mesajından belirlenir (prompt
+        # zaten kullanıcının ifadesini birinci öncelik sayar), asistan cevabı normalde duyguyu etkilemez;
+        # karşılığında istek başına tek LLM çağrısı yapılır ve bu çağrı LoRA üretimiyle örtüşür
+        emotion_data = None
+        speculative_content = None
+        if keyword_mood:
+            log.debug("[EMOTION] Duygu mesajdaki ifadeden belirlendi (LLM çağrısı yok): %s", keyword_mood)
+            emotion_data = {"ruh_hali": keyword_mood}
+        else:
+            log.debug("[EMOTION] LLM'den duygu analizi yapılıyor...")
+            speculative_content = mood_future.result()
+        if speculative_content is not None:
+            emotion_data = parse_emotion_json(speculative_content)
+            if not emotion_data or str(emotion_data.get("ruh_hali", "")).strip() not in self.allowed_moods:
+                log.debug("[EMOTION] Kullanıcı mesajından duygu belirlenemedi, LoRA cevabıyla birlikte analiz ediliyor")
+                emotion_data = None
         
-        emotion_data = extract_json_object(emotion_content)
+        if emotion_data is None:
+            emotion_content = self._classify_mood_cached(user_message, lora_response)
+            if emotion_content is None:
+                emotion_content = json.dumps({
+                    "ruh_hali": random.choice(["Mutlu", "Üzgün", "Şaşkın"])
+                })
+            emotion_data = parse_emotion_json(emotion_content)
         
         # Fallback: JSON parse edilemezse rastgele duygu
         if not emotion_data:
-            print("[WARNING] LLM'den JSON parse edilemedi, rastgele duygu seçiliyor")
+            log.warning("[WARNING] LLM'den JSON parse edilemedi, rastgele duygu seçiliyor")
             emotion_data = {
                 "ruh_hali": random.choice(["Mutlu", "Üzgün", "Şaşkın"])
             }
@@ -789,102 +1276,49 @@ Seçilebilecek ruh halleri (sadece bu listeden seç):
         # Duygu kaydını zaman damgasıyla ekle
         mood_raw = str(emotion_data.get("ruh_hali", ""))
         normalized_mood = mood_raw.strip()
-        if normalized_mood in self.emotion_counts:
-            self.emotion_counts[normalized_mood] += 1
-            print(f"[EMOTION] Duygu kaydedildi: {normalized_mood}")
+        mood_id = self._mood_ids.get(normalized_mood)
+        if mood_id is not None:
+            self.emotion_counts[mood_id] += 1
+            log.debug("[EMOTION] Duygu kaydedildi: %s", normalized_mood)
         else:
-            print(f"[EMOTION] Duygu kaydedilemedi: '{normalized_mood}' allowed_moods listesinde yok")
+            log.warning("[EMOTION] Duygu kaydedilemedi: '%s' allowed_moods listesinde yok", normalized_mood)
         
         if user_id:
             self._log_mood_to_db(user_id, normalized_mood)
         
         # Emoji seçim: mood_emojis.json'dan duyguya göre rastgele
-        def normalize_mood(name: str) -> str:
-            """Duygu ismini mood_emojis.json'daki anahtarlara normalize eder"""
-            n = name.strip()
-            n_lower = n.lower()
-            
-            # Direkt JSON anahtarlarını kontrol et
-            json_keys = list(MOOD_EMOJIS.keys())
-            for key in json_keys:
-                if key.lower() == n_lower:
-                    return key
-            
-            # Yazım hatalarını düzelt
-            mapping = {
-                "güllümseyen": "Gülümseyen",
-                "gülümseyen": "Gülümseyen",
-                "gullumseyen": "Gülümseyen",
-                "gulumsyen": "Gülümseyen",
-                "utangaç": "Utanmış",
-                "utanmış": "Utanmış",
-                "utanmis": "Utanmış",
-                "utangac": "Utanmış",
-                "mutlu": "Mutlu",
-                "üzgün": "Üzgün",
-                "uzgun": "Üzgün",
-                "öfkeli": "Öfkeli",
-                "ofkeli": "Öfkeli",
-                "şaşkın": "Şaşkın",
-                "saskin": "Şaşkın",
-                "endişeli": "Endişeli",
-                "endiseli": "Endişeli",
-                "flörtöz": "Flörtöz",
-                "flortoz": "Flörtöz",
-                "flörtoz": "Flörtöz",
-                "flortöz": "Flörtöz",
-                "sorgulayıcı": "Sorgulayıcı",
-                "sorgulayici": "Sorgulayıcı",
-                "yorgun": "Yorgun",
-            }
-            
-            normalized = mapping.get(n_lower)
-            if normalized and normalized in json_keys:
-                return normalized
-            
-            return n
-        
         def pick_emoji(mood: str) -> Optional[str]:
             """mood_emojis.json'dan duyguya göre rastgele emoji seçer"""
             key = normalize_mood(mood)
-            print(f"[EMOTION] Duygu normalize edildi: '{mood}' -> '{key}'")
+            log.debug("[EMOTION] Duygu normalize edildi: '%s' -> '%s'", mood, key)
             
             # JSON'daki anahtarları direkt kontrol et
-            options = MOOD_EMOJIS.get(key)
+            options = _MOOD_OPTIONS.get(key)
             if options:
-                try:
-                    selected_emoji = random.choice(options)
-                    print(f"[EMOTION] Emoji seçildi: {selected_emoji} (duygu: {key}, seçenekler: {len(options)})")
-                    return selected_emoji
-                except Exception as e:
-                    print(f"[EMOTION] Emoji seçim hatası: {e}")
-                    return None
-            
-            # Fallback: fuzzy matching
-            print(f"[EMOTION] Direkt eşleşme bulunamadı, fuzzy matching deneniyor...")
-            for json_key in MOOD_EMOJIS.keys():
-                if json_key.lower() in key.lower() or key.lower() in json_key.lower():
-                    options = MOOD_EMOJIS.get(json_key)
-                    if options:
-                        try:
-                            selected_emoji = random.choice(options)
-                            print(f"[EMOTION] Emoji seçildi (fuzzy): {selected_emoji} (duygu: {key} -> {json_key})")
-                            return selected_emoji
-                        except Exception as e:
-                            print(f"[EMOTION] Fuzzy emoji seçim hatası: {e}")
-                            continue
-            
-            print(f"[EMOTION] Emoji bulunamadı: {key}")
+                selected_emoji = options[_rng.randrange(len(options))]
+                log.debug("[EMOTION] Emoji seçildi: %s (duygu: %s, seçenekler: %d)", selected_emoji, key, len(options))
+                return selected_emoji
+            
+            # Fallback: fuzzy matching (eşleşen anahtar önbellekten gelir, sadece emoji seçimi her seferinde yapılır)
+            log.debug("[EMOTION] Direkt eşleşme bulunamadı, fuzzy matching deneniyor...")
+            json_key = _fuzzy_key(key.lower())
+            if json_key is not None:
+                options = _MOOD_OPTIONS[json_key]
+                selected_emoji = options[_rng.randrange(len(options))]
+                log.debug("[EMOTION] Emoji seçildi (fuzzy): %s (duygu: %s -> %s)", selected_emoji, key, json_key)
+                return selected_emoji
+            
+            log.debug("[EMOTION] Emoji bulunamadı: %s", key)
             return None
         
         emoji = pick_emoji(mood_raw)
         if emoji:
-            print(f"[EMOTION] Final emoji: {emoji}")
+            log.debug("[EMOTION] Final emoji: %s", emoji)
         else:
-            print(f"[EMOTION] WARNING: Emoji None döndü! Duygu: {mood_raw}")
+            log.warning("[EMOTION] WARNING: Emoji None döndü! Duygu: %s", mood_raw)
             # Fallback: eğer emoji bulunamazsa varsayılan emoji kullan
             emoji = '❓'
-            print(f"[EMOTION] Fallback emoji kullanılıyor: {emoji}")
+            log.debug("[EMOTION] Fallback emoji kullanılıyor: %s", emoji)
         
         # Response format: Frontend'in beklediği format
         return {